@@ -3,15 +3,18 @@
 This agent follows official LangGraph ReAct patterns with Claude Sonnet 4.5
 and can make tool calls to the Indufix LlamaIndex toolkit.
 """
+import hashlib
+import json
+import logging
 import os
-from typing import Literal
+import uuid
+from typing import Any, AsyncIterator, Dict, Literal
 
-from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import SystemMessage
-from langgraph.graph import StateGraph, MessagesState, START, END
-from langgraph.prebuilt import ToolNode
+logger = logging.getLogger(__name__)
 
-from indufix_toolkit import TOOLS
+# Heavy dependencies (langchain_anthropic, langgraph, the toolkit tools) are
+# imported inside create_agent(), and the module-level `graph` is built on
+# first access, so importing this module stays cheap for CLI scripts.
 
 
 # System message to guide the agent's behavior
@@ -36,44 +39,370 @@ When values are inferred, clearly communicate the confidence penalty.
 """
 
 
+# Model configuration; part of the answer cache key (see config_version)
+MODEL_CONFIG = {
+    "model": "claude-sonnet-4-5-20250929",
+    "temperature": 0.0,  # Deterministic for technical queries
+    "max_tokens": 4096,
+}
+
+# Whole-answer cache in front of the graph: repeated single-turn questions
+# are answered without any LLM or tool call. Keyed on the normalized query,
+# the index version and the agent config version. 0 disables it.
+ANSWER_CACHE_MAXSIZE = int(os.getenv("INDUFIX_ANSWER_CACHE_MAXSIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("INDUFIX_ANSWER_CACHE_TTL", "3600"))
+
+_answer_cache = None
+
+# Deterministic fast path: pure lookups ("equivalência DIN 933") are routed
+# straight to the matching tool and answered from a template, with no LLM call
+FAST_PATH_ENABLED = os.getenv("INDUFIX_FAST_PATH", "true").lower() in ("1", "true", "yes")
+
+# Anthropic prompt caching: breakpoints on the tool definitions, the system
+# prompt and the conversation prefix, so each tool -> agent hop re-reads the
+# shared prefix from cache instead of reprocessing it.
+PROMPT_CACHE_ENABLED = os.getenv("INDUFIX_PROMPT_CACHE", "true").lower() in ("1", "true", "yes")
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# Token usage accumulated across LLM calls in this process
+_usage = {
+    "calls": 0,
+    "input_tokens": 0,
+    "output_tokens": 0,
+    "cache_read_tokens": 0,
+    "cache_creation_tokens": 0,
+}
+
+
+def record_usage(response: Any) -> None:
+    """Accumulate token usage (including prompt cache reads/writes) of a response."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    details = usage.get("input_token_details") or {}
+    _usage["calls"] += 1
+    _usage["input_tokens"] += usage.get("input_tokens") or 0
+    _usage["output_tokens"] += usage.get("output_tokens") or 0
+    _usage["cache_read_tokens"] += details.get("cache_read") or 0
+    _usage["cache_creation_tokens"] += details.get("cache_creation") or 0
+    logger.debug(
+        f"LLM usage: input={usage.get('input_tokens')} output={usage.get('output_tokens')} "
+        f"cache_read={details.get('cache_read')} cache_creation={details.get('cache_creation')}"
+    )
+
+
+def usage_stats() -> Dict[str, Any]:
+    """Token usage totals, with the share of input tokens served from the prompt cache.
+
+    Returns:
+        Dict with call count, input/output tokens, cache read/creation tokens
+        and cache_hit_rate
+    """
+    stats = dict(_usage)
+    total_input = stats["input_tokens"]
+    stats["cache_hit_rate"] = stats["cache_read_tokens"] / total_input if total_input else 0.0
+    return stats
+
+
+def with_cache_breakpoint(messages: list) -> list:
+    """Mark the end of the conversation prefix as a prompt cache breakpoint.
+
+    The last human/tool message gets `cache_control` on its last content
+    block, so the next hop of the ReAct loop reads everything up to it from
+    cache. The state itself is left untouched (messages are copied).
+
+    Args:
+        messages: Messages about to be sent to the LLM
+
+    Returns:
+        Messages with the breakpoint applied (or unchanged if not applicable)
+    """
+    from langchain_core.messages import HumanMessage, ToolMessage
+
+    if not messages or not isinstance(messages[-1], (HumanMessage, ToolMessage)):
+        return messages
+    last = messages[-1]
+    content = last.content
+    if isinstance(content, str):
+        if not content:
+            return messages
+        content = [{"type": "text", "text": content, "cache_control": CACHE_CONTROL}]
+    elif content and isinstance(content[-1], dict):
+        content = content[:-1] + [{**content[-1], "cache_control": CACHE_CONTROL}]
+    else:
+        return messages
+    return messages[:-1] + [last.model_copy(update={"content": content})]
+
+
+def config_version() -> str:
+    """Fingerprint of everything that shapes an answer besides the query.
+
+    Returns:
+        Short hash of the model config, system prompt, tool set and flags
+    """
+    from indufix_toolkit import TOOLS
+
+    config = {
+        "model": MODEL_CONFIG,
+        "system": SYSTEM_MESSAGE,
+        "tools": sorted(t.name for t in TOOLS),
+        "fast_path": FAST_PATH_ENABLED,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def get_answer_cache():
+    """Get or create the answer cache, cleared whenever the index version changes.
+
+    Returns:
+        The shared TTLCache, or None if disabled
+    """
+    global _answer_cache
+    if _answer_cache is None and ANSWER_CACHE_MAXSIZE > 0:
+        from indufix_toolkit import index_version
+        from indufix_toolkit.cache import TTLCache
+
+        _answer_cache = TTLCache(maxsize=ANSWER_CACHE_MAXSIZE, ttl=ANSWER_CACHE_TTL)
+        # Keys already carry the version; clearing just frees the memory early
+        index_version.add_listener(lambda previous, current: _answer_cache.clear())
+    return _answer_cache
+
+
+def answer_cache_stats() -> Dict[str, Any]:
+    """Hit/miss statistics of the answer cache.
+
+    Returns:
+        TTLCache stats, or an empty dict if the cache is disabled
+    """
+    cache = get_answer_cache()
+    return cache.stats() if cache is not None else {}
+
+
 def create_agent():
     """Create the LangGraph agent with LLM and tools bound.
 
     Returns:
         Compiled LangGraph agent ready for invocation
     """
+    from langchain_anthropic import ChatAnthropic
+    from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+    from langchain_core.runnables import RunnableLambda
+    from langgraph.graph import StateGraph, MessagesState, START, END
+    from langgraph.prebuilt import ToolNode
+
+    from indufix_toolkit import TOOLS, index_version, normalize_query
+    from indufix_toolkit.router import classify, render_answer
+
     # Initialize Claude Sonnet 4.5 with proper configuration
     llm = ChatAnthropic(
-        model="claude-sonnet-4-5-20250929",
         api_key=os.getenv("ANTHROPIC_API_KEY"),
-        temperature=0.0,  # Deterministic for technical queries
-        max_tokens=4096,
+        **MODEL_CONFIG,
     )
 
     # Bind tools to the LLM
-    llm_with_tools = llm.bind_tools(TOOLS)
+    if PROMPT_CACHE_ENABLED:
+        from langchain_anthropic.chat_models import convert_to_anthropic_tool
+
+        # Breakpoint on the last tool caches every tool definition
+        tool_definitions = [dict(convert_to_anthropic_tool(t)) for t in TOOLS]
+        tool_definitions[-1]["cache_control"] = CACHE_CONTROL
+        llm_with_tools = llm.bind_tools(tool_definitions)
+        system_message = SystemMessage(
+            content=[{"type": "text", "text": SYSTEM_MESSAGE, "cache_control": CACHE_CONTROL}]
+        )
+    else:
+        llm_with_tools = llm.bind_tools(TOOLS)
+        system_message = SystemMessage(content=SYSTEM_MESSAGE)
+
+    def with_system_message(messages: list) -> list:
+        """Prepend the system message if this is the first call."""
+        if not any(isinstance(msg, SystemMessage) for msg in messages):
+            messages = [system_message] + messages
+        if PROMPT_CACHE_ENABLED:
+            messages = with_cache_breakpoint(messages)
+        return messages
 
     # Define the agent node that calls the LLM
-    def call_model(state: MessagesState) -> dict:
+    async def acall_model(state: MessagesState) -> dict:
         """Agent node that invokes the LLM with bound tools.
 
+        Awaits the Anthropic call, so a single worker can serve many
+        conversations while their generations are pending.
+
         Args:
             state: Current conversation state with messages
 
         Returns:
             Updated state with LLM response
         """
-        messages = state["messages"]
+        messages = with_system_message(state["messages"])
+        response = await llm_with_tools.ainvoke(messages)
+        record_usage(response)
+        return {"messages": [response]}
 
-        # Add system message if this is the first call
-        if not any(isinstance(msg, SystemMessage) for msg in messages):
-            messages = [SystemMessage(content=SYSTEM_MESSAGE)] + messages
+    def call_model(state: MessagesState) -> dict:
+        """Synchronous fallback of acall_model, used by graph.invoke/stream.
 
-        # Invoke LLM with tools
-        response = llm_with_tools.invoke(messages)
+        Args:
+            state: Current conversation state with messages
 
+        Returns:
+            Updated state with LLM response
+        """
+        messages = with_system_message(state["messages"])
+        response = llm_with_tools.invoke(messages)
+        record_usage(response)
         return {"messages": [response]}
 
+    tools_by_name = {t.name: t for t in TOOLS}
+    answer_cache = get_answer_cache()
+    agent_version = config_version()
+
+    def single_turn_query(messages: list):
+        """The user query if this is a fresh single-turn conversation, else None."""
+        humans = [msg for msg in messages if isinstance(msg, HumanMessage)]
+        if len(humans) != 1 or not isinstance(humans[0].content, str):
+            return None
+        return humans[0].content
+
+    def answer_key(query: str, version) -> tuple:
+        # Whitespace/case only: word order and language change the answer
+        # ("DIN 933 para ISO 4017" vs. the reverse, "hex bolt" vs. "parafuso
+        # sextavado"), so the full canonical form is kept for retrieval keys
+        return (version, agent_version, normalize_query(query))
+
+    # Define the answer cache nodes
+    async def alookup_answer(state: MessagesState) -> dict:
+        """Answer cache node: serve a previous answer to the same question.
+
+        Only fresh single-turn conversations are looked up, since the answer
+        to a follow-up depends on the history.
+
+        Args:
+            state: Current conversation state with messages
+
+        Returns:
+            Updated state with the cached answer, or no update on a miss
+        """
+        query = single_turn_query(state["messages"])
+        if query is None:
+            return {}
+        answer = answer_cache.get(answer_key(query, await index_version.current()))
+        if answer is None:
+            return {}
+        return {"messages": [AIMessage(content=answer, response_metadata={"answer_cache": "hit"})]}
+
+    def lookup_answer(state: MessagesState) -> dict:
+        """Synchronous answer cache lookup, with the last known index version.
+
+        Args:
+            state: Current conversation state with messages
+
+        Returns:
+            Updated state with the cached answer, or no update on a miss
+        """
+        query = single_turn_query(state["messages"])
+        if query is None:
+            return {}
+        answer = answer_cache.get(answer_key(query, index_version.version))
+        if answer is None:
+            return {}
+        return {"messages": [AIMessage(content=answer, response_metadata={"answer_cache": "hit"})]}
+
+    def store_answer(state: MessagesState) -> dict:
+        """Store the final answer of a single-turn conversation.
+
+        Answers built on degraded tool results (stale cache or snapshot
+        fallback) are not stored.
+
+        Args:
+            state: Current conversation state with messages
+
+        Returns:
+            No state update
+        """
+        messages = state["messages"]
+        query = single_turn_query(messages)
+        answer = messages[-1].content
+        if query is None or not isinstance(answer, str) or not answer:
+            return {}
+        if any(isinstance(msg, ToolMessage) and '"degraded"' in str(msg.content) for msg in messages):
+            return {}
+        answer_cache.set(answer_key(query, index_version.version), answer)
+        return {}
+
+    def after_lookup(state: MessagesState) -> Literal["next", "end"]:
+        """End on a cache hit, otherwise continue to the router/agent.
+
+        Args:
+            state: Current conversation state
+
+        Returns:
+            "end" if the cache answered, "next" otherwise
+        """
+        return "end" if isinstance(state["messages"][-1], AIMessage) else "next"
+
+    # Define the fast-path router node
+    async def aroute_query(state: MessagesState) -> dict:
+        """Router node that answers pure lookups with a direct tool call.
+
+        Classifies the latest user message with cheap rules and the fastener
+        parser. On a confident match the tool is called directly and the
+        answer is templated; the tool call is recorded in the history so
+        follow-up turns see it. Anything else is left to the LLM.
+
+        Args:
+            state: Current conversation state with messages
+
+        Returns:
+            Updated state with the templated answer, or no update to fall
+            through to the agent node
+        """
+        last = state["messages"][-1]
+        if not isinstance(last, HumanMessage) or not isinstance(last.content, str):
+            return {}
+        route = classify(last.content)
+        if route is None:
+            return {}
+
+        try:
+            result = await tools_by_name[route.tool].ainvoke(route.args)
+        except Exception as e:
+            logger.warning(f"Fast path {route.tool} failed, falling back to the LLM: {e}")
+            return {}
+
+        call_id = f"fastpath_{uuid.uuid4().hex[:12]}"
+        return {
+            "messages": [
+                AIMessage(content="", tool_calls=[{"name": route.tool, "args": route.args, "id": call_id}]),
+                ToolMessage(content=json.dumps(result, ensure_ascii=False), tool_call_id=call_id, name=route.tool),
+                AIMessage(content=render_answer(route, result)),
+            ]
+        }
+
+    def route_query(state: MessagesState) -> dict:
+        """Synchronous graphs skip the fast path (the tools are async-only).
+
+        Args:
+            state: Current conversation state
+
+        Returns:
+            No update, so the query goes to the agent node
+        """
+        return {}
+
+    def after_router(state: MessagesState) -> Literal["agent", "end"]:
+        """End if the router already answered, otherwise go to the LLM.
+
+        Args:
+            state: Current conversation state
+
+        Returns:
+            "end" if the last message is a final answer, "agent" otherwise
+        """
+        last_message = state["messages"][-1]
+        if isinstance(last_message, AIMessage) and not last_message.tool_calls:
+            return "end"
+        return "agent"
+
     # Define routing logic
     def should_continue(state: MessagesState) -> Literal["tools", "end"]:
         """Determine whether to continue with tools or end.
@@ -97,17 +426,47 @@ def create_agent():
     workflow = StateGraph(MessagesState)
 
     # Add nodes
-    workflow.add_node("agent", call_model)
+    # ainvoke/astream run acall_model; invoke/stream fall back to call_model
+    workflow.add_node("agent", RunnableLambda(call_model, afunc=acall_model))
     workflow.add_node("tools", ToolNode(TOOLS))
 
     # Add edges
-    workflow.add_edge(START, "agent")
+    # START -> [answer cache] -> [router] -> agent <-> tools -> [store answer] -> END
+    first = "router" if FAST_PATH_ENABLED else "agent"
+    finish = "store_answer" if answer_cache is not None else END
+
+    if answer_cache is not None:
+        workflow.add_node("answer_cache", RunnableLambda(lookup_answer, afunc=alookup_answer))
+        workflow.add_node("store_answer", store_answer)
+        workflow.add_edge(START, "answer_cache")
+        workflow.add_conditional_edges(
+            "answer_cache",
+            after_lookup,
+            {
+                "next": first,
+                "end": END,
+            }
+        )
+        workflow.add_edge("store_answer", END)
+    else:
+        workflow.add_edge(START, first)
+
+    if FAST_PATH_ENABLED:
+        workflow.add_node("router", RunnableLambda(route_query, afunc=aroute_query))
+        workflow.add_conditional_edges(
+            "router",
+            after_router,
+            {
+                "agent": "agent",
+                "end": finish,
+            }
+        )
     workflow.add_conditional_edges(
         "agent",
         should_continue,
         {
             "tools": "tools",
-            "end": END,
+            "end": finish,
         }
     )
     workflow.add_edge("tools", "agent")
@@ -132,20 +491,32 @@ def get_graph():
     return _graph
 
 
-# Create the graph attribute for backward compatibility
-# This will raise an error if API key is not set, but only when accessed
-try:
-    graph = create_agent()
-except Exception:
-    # If creation fails (e.g., no API key), provide a lazy loader
-    class LazyGraph:
-        def __getattr__(self, name):
-            return getattr(get_graph(), name)
+class LazyGraph:
+    """Proxy that builds the graph on first use (e.g., when no API key is set yet)."""
+
+    def __getattr__(self, name):
+        return getattr(get_graph(), name)
 
-        def __call__(self, *args, **kwargs):
-            return get_graph()(*args, **kwargs)
+    def __call__(self, *args, **kwargs):
+        return get_graph()(*args, **kwargs)
 
-    graph = LazyGraph()
+
+def __getattr__(name):
+    """Build the module-level `graph` on first access (PEP 562).
+
+    The LangGraph server (langgraph.json -> ./agent.py:graph) and
+    `from agent import graph` both go through here, so the graph is still
+    compiled once per process, just not at import time.
+    """
+    if name == "graph":
+        global graph
+        try:
+            graph = get_graph()
+        except Exception:
+            # If creation fails (e.g., no API key), provide a lazy loader
+            graph = LazyGraph()
+        return graph
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # Convenience function for testing and direct usage
@@ -167,6 +538,75 @@ async def run_agent(query: str) -> str:
     return result["messages"][-1].content
 
 
+def _text(content: Any) -> str:
+    """Text of a message content (plain string or Anthropic content blocks)."""
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block.get("text", "") for block in content
+        if isinstance(block, dict) and block.get("type") == "text"
+    )
+
+
+async def astream_agent(query: str) -> AsyncIterator[Dict[str, Any]]:
+    """Run the agent and yield events as they happen.
+
+    Built on the graph's astream with the "messages" (LLM tokens),
+    "custom" (chunks written by streaming tools) and "updates" (node
+    outputs) modes, so callers like the MCP/HTTP layers can forward output
+    at time-to-first-token instead of waiting for the final synthesis.
+
+    Events:
+        {"type": "token", "content": str}: LLM text token
+        {"type": "tool_start", "name": str, "id": str, "input": dict}
+        {"type": "tool_chunk", "name": str, "content": str}: streaming tool output
+        {"type": "tool_end", "name": str, "id": str, "output": str}
+        {"type": "answer", "content": str}: final answer (also for fast path
+            and answer cache hits, which produce no tokens)
+
+    Args:
+        query: User query to process
+
+    Yields:
+        Event dicts in the order they happen
+    """
+    from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+
+    answer = None
+    async for mode, payload in get_graph().astream(
+        {"messages": [HumanMessage(content=query)]},
+        stream_mode=["messages", "custom", "updates"],
+    ):
+        if mode == "messages":
+            chunk, metadata = payload
+            if isinstance(chunk, AIMessageChunk) and metadata.get("langgraph_node") == "agent":
+                text = _text(chunk.content)
+                if text:
+                    yield {"type": "token", "content": text}
+
+        elif mode == "custom":
+            if isinstance(payload, dict) and "chunk" in payload:
+                yield {"type": "tool_chunk", "name": payload.get("tool"), "content": payload["chunk"]}
+
+        else:
+            for update in payload.values():
+                for message in (update or {}).get("messages", []):
+                    if isinstance(message, AIMessage) and message.tool_calls:
+                        for call in message.tool_calls:
+                            yield {"type": "tool_start", "name": call["name"], "id": call["id"], "input": call["args"]}
+                    elif isinstance(message, ToolMessage):
+                        yield {
+                            "type": "tool_end",
+                            "name": message.name,
+                            "id": message.tool_call_id,
+                            "output": _text(message.content),
+                        }
+                    elif isinstance(message, AIMessage):
+                        answer = _text(message.content)
+
+    yield {"type": "answer", "content": answer or ""}
+
+
 if __name__ == "__main__":
     import asyncio
 
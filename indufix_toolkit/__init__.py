@@ -1,9 +1,43 @@
-"""Indufix LlamaIndex Toolkit - Custom tools using llama_cloud_services"""
-from langchain_core.tools import tool
-from llama_cloud_services import LlamaCloudIndex
-import httpx
+"""Indufix LlamaIndex Toolkit - Custom tools using llama_cloud_services
+
+As tools LangChain ficam em `indufix_toolkit.tools` e são carregadas na
+primeira leitura de `TOOLS` (ou de uma tool pelo nome). Dependências
+pesadas (llama_cloud_services, httpx, langchain_core) só são importadas
+no primeiro uso, mantendo o import do pacote barato para o servidor e
+para os scripts CLI.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import atexit
+import contextlib
+import contextvars
+import copy
+import functools
+import importlib.util
+import logging
 import os
-from typing import List, Dict, Any
+import re
+import threading
+import time
+from typing import List, Dict, Any, AsyncIterator, Callable, Awaitable, Iterator, Optional
+
+from indufix_toolkit.cache import SingleFlight, SQLiteCache, TTLCache
+from indufix_toolkit.canonical import FastenerSpec, canonical_query, parse_spec
+from indufix_toolkit.equivalences import EquivalenceGraph
+from indufix_toolkit.resilience import (
+    LANE_BULK,
+    LANE_INTERACTIVE,
+    AdaptiveLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    LatencyTracker,
+    hedged,
+    is_upstream_failure,
+)
+from indufix_toolkit.versioning import IndexVersionMonitor
+
+logger = logging.getLogger(__name__)
 
 # Configuração LlamaCloud
 LLAMA_CONFIG = {
@@ -14,215 +48,948 @@ LLAMA_CONFIG = {
 }
 
 PIPELINE_ENDPOINT = "https://api.cloud.llamaindex.ai/api/v1/pipelines/1bc5e382-d0b6-4dcf-98c5-bf4ce8f67301/retrieve"
+PIPELINE_ID = re.search(r"/pipelines/([^/]+)/", PIPELINE_ENDPOINT).group(1)
+
+# Backend de retrieval: "cloud" (LlamaCloud) ou "local" (snapshot em disco,
+# gerado com `python -m indufix_toolkit.snapshot export`)
+RETRIEVAL_BACKEND = os.getenv("INDUFIX_RETRIEVAL_BACKEND", "cloud")
+SNAPSHOT_PATH = os.getenv("INDUFIX_SNAPSHOT_PATH", "snapshot")
 
 # Lazy initialization helpers
+# Inicialização exatamente uma vez, mesmo com a primeira rajada concorrente
+# (threads do executor e do warm-up). RLock: get_retriever chama get_index.
+_init_lock = threading.RLock()
 _index = None
-_retriever = None
 _query_engine = None
+_streaming_query_engine = None
+_snapshot = None
 
 def get_index():
     global _index
     if _index is None:
-        _index = LlamaCloudIndex(**LLAMA_CONFIG)
+        with _init_lock:
+            if _index is None:
+                from llama_cloud_services import LlamaCloudIndex
+                _index = LlamaCloudIndex(**LLAMA_CONFIG)
     return _index
 
-def get_retriever():
-    global _retriever
-    if _retriever is None:
-        _retriever = get_index().as_retriever()
-    return _retriever
+def get_snapshot():
+    global _snapshot
+    if _snapshot is None:
+        with _init_lock:
+            if _snapshot is None:
+                from indufix_toolkit.snapshot import Snapshot
+                _snapshot = Snapshot(SNAPSHOT_PATH)
+    return _snapshot
+
+# Retrievers base por top_k (poucos valores distintos, LRU limitado). Os
+# filtros variam por consulta e são aplicados numa cópia rasa do retriever
+# base: nenhuma resolução de projeto/pipeline via HTTP por combinação de
+# filtros. A construção usa um lock por top_k, não o _init_lock global.
+RETRIEVER_CACHE_SIZE = int(os.getenv("INDUFIX_RETRIEVER_CACHE_SIZE", "16"))
+
+_retrievers: "OrderedDict[Optional[int], Any]" = OrderedDict()
+_retrievers_lock = threading.Lock()
+_retriever_build_locks: Dict[Optional[int], threading.Lock] = {}
+
+
+def _cached_retriever(similarity_top_k: Optional[int]):
+    with _retrievers_lock:
+        retriever = _retrievers.get(similarity_top_k)
+        if retriever is not None:
+            _retrievers.move_to_end(similarity_top_k)
+        return retriever
+
+
+def _build_retriever(similarity_top_k: Optional[int]):
+    with _retrievers_lock:
+        build_lock = _retriever_build_locks.setdefault(similarity_top_k, threading.Lock())
+    with build_lock:
+        retriever = _cached_retriever(similarity_top_k)
+        if retriever is not None:
+            return retriever
+        kwargs: Dict[str, Any] = {}
+        if similarity_top_k is not None:
+            kwargs["similarity_top_k"] = similarity_top_k
+        if RETRIEVAL_BACKEND == "local":
+            from indufix_toolkit.snapshot import LocalRetriever
+            retriever = LocalRetriever(get_snapshot(), **kwargs)
+        else:
+            retriever = get_index().as_retriever(**kwargs)
+        with _retrievers_lock:
+            _retrievers[similarity_top_k] = retriever
+            while len(_retrievers) > RETRIEVER_CACHE_SIZE:
+                evicted, _ = _retrievers.popitem(last=False)
+                _retriever_build_locks.pop(evicted, None)
+    return retriever
+
+
+def _with_filters(retriever: Any, filters: Any):
+    if filters is None:
+        return retriever
+    scoped = copy.copy(retriever)
+    if hasattr(scoped, "_filters"):
+        # LlamaCloudRetriever envia _filters como search_filters em cada busca
+        scoped._filters = filters
+    else:
+        scoped.filters = filters
+    return scoped
+
+
+def get_retriever(similarity_top_k: Optional[int] = None, filters: Any = None):
+    """Retriever por (top_k, filtros), com top_k aplicado no LlamaCloud."""
+    retriever = _cached_retriever(similarity_top_k) or _build_retriever(similarity_top_k)
+    return _with_filters(retriever, filters)
 
 def get_query_engine():
     global _query_engine
     if _query_engine is None:
-        _query_engine = get_index().as_query_engine()
+        with _init_lock:
+            if _query_engine is None:
+                _query_engine = get_index().as_query_engine()
     return _query_engine
 
+def get_streaming_query_engine():
+    global _streaming_query_engine
+    if _streaming_query_engine is None:
+        with _init_lock:
+            if _streaming_query_engine is None:
+                _streaming_query_engine = get_index().as_query_engine(streaming=True)
+    return _streaming_query_engine
 
-@tool
-async def retrieve_matching_rules(query: str, top_k: int = 5) -> Dict[str, Any]:
-    """
-    Recupera regras de matching da base Indufix via LlamaCloud Index.
-    
-    Use para:
-    - Buscar valores default para atributos ausentes
-    - Encontrar equivalências de padrões (DIN 933 = ISO 4017)
-    - Obter penalidades de confiança para valores inferidos
-    - Recuperar mapeamentos Odoo
-    
-    Args:
-        query: Consulta de busca (ex: "parafuso M10 valores default")
-        top_k: Número de resultados (default: 5)
-    
-    Returns:
-        dict com nodes contendo text, score e metadata
-    """
-    nodes = get_retriever().retrieve(query)
-    return {
-        "query": query,
-        "nodes": [
-            {
-                "text": node.text,
-                "score": node.score if hasattr(node, 'score') else 1.0,
-                "metadata": node.metadata if hasattr(node, 'metadata') else {}
-            }
-            for node in nodes[:top_k]
-        ]
-    }
 
+# Caminho assíncrono: nada de I/O síncrono dentro do event loop do servidor.
+# Trabalho bloqueante (construção do índice, fallback síncrono) roda num pool
+# de threads limitado, para que uma sessão lenta não trave as demais.
+EXECUTOR_MAX_WORKERS = int(os.getenv("INDUFIX_EXECUTOR_MAX_WORKERS", "8"))
 
-@tool
-async def query_indufix_knowledge(query: str) -> str:
-    """
-    Consulta a base de conhecimento Indufix com resposta processada.
-    
-    Usa o query engine que processa e sintetiza a resposta baseada
-    nos documentos recuperados.
-    
-    Args:
-        query: Pergunta em linguagem natural
-    
-    Returns:
-        str com resposta sintetizada
-    """
-    response = get_query_engine().query(query)
-    return str(response)
+_executor = ThreadPoolExecutor(
+    max_workers=EXECUTOR_MAX_WORKERS,
+    thread_name_prefix="indufix-retrieval",
+)
 
 
-@tool
-async def get_default_values(product_type: str, missing_attributes: List[str]) -> Dict[str, Any]:
-    """
-    Busca valores default para atributos ausentes de um tipo de produto.
-    
-    Args:
-        product_type: Tipo do produto (ex: "parafuso_sextavado", "porca")
-        missing_attributes: Lista de atributos faltantes (ex: ["material", "acabamento"])
-    
-    Returns:
-        dict com valores default e penalidades de confiança
-    """
-    query = f"valores default para {product_type}: {', '.join(missing_attributes)}"
-    nodes = get_retriever().retrieve(query)
-    
-    defaults = []
-    for i, attr in enumerate(missing_attributes):
-        if i < len(nodes):
-            node = nodes[i]
-            defaults.append({
-                "attribute": attr,
-                "suggested_value": node.metadata.get("default_value") if hasattr(node, 'metadata') else None,
-                "confidence_penalty": node.metadata.get("penalty", 0.1) if hasattr(node, 'metadata') else 0.1,
-                "source": node.text[:200] if hasattr(node, 'text') else ""
-            })
-    
+async def run_blocking(func: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Executa uma chamada síncrona no pool limitado, sem bloquear o loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+async def aget_index():
+    if _index is not None:
+        return _index
+    return await run_blocking(get_index)
+
+
+async def aget_retriever(similarity_top_k: Optional[int] = None, filters: Any = None):
+    retriever = _cached_retriever(similarity_top_k)
+    if retriever is not None:
+        return _with_filters(retriever, filters)
+    # A primeira construção resolve projeto/pipeline via HTTP síncrono
+    return await run_blocking(get_retriever, similarity_top_k, filters)
+
+
+async def aget_query_engine():
+    if _query_engine is not None:
+        return _query_engine
+    return await run_blocking(get_query_engine)
+
+
+async def aget_streaming_query_engine():
+    if _streaming_query_engine is not None:
+        return _streaming_query_engine
+    return await run_blocking(get_streaming_query_engine)
+
+
+async def astream_knowledge(query: str) -> AsyncIterator[str]:
+    """Gera a resposta sintetizada em chunks, à medida que o LLM produz."""
+    query_engine = await aget_streaming_query_engine()
+    response = await query_engine.aquery(query)
+    if hasattr(response, "async_response_gen"):
+        async for chunk in response.async_response_gen():
+            yield chunk
+    elif hasattr(response, "response_gen"):
+        # StreamingResponse síncrono: cada next() bloqueia até o próximo token
+        generator = response.response_gen
+        while True:
+            chunk = await run_blocking(next, generator, None)
+            if chunk is None:
+                break
+            yield chunk
+    else:
+        yield str(response)
+
+
+async def _aretrieve_index(query: str, top_k: Optional[int] = None, filters: Any = None) -> List[Any]:
+    """Recupera nodes usando a API assíncrona nativa do retriever."""
+    retriever = await aget_retriever(top_k, filters)
+    if hasattr(retriever, "aretrieve"):
+        return await retriever.aretrieve(query)
+    return await run_blocking(retriever.retrieve, query)
+
+
+async def aretrieve(query: str, top_k: Optional[int] = None, filters: Any = None) -> List[Any]:
+    """Recupera nodes do índice (com hedge para o pipeline endpoint, se ativo)."""
+    if serving_from_snapshot():
+        from indufix_toolkit.snapshot import LocalRetriever
+        return await LocalRetriever(get_snapshot(), top_k, filters).aretrieve(query)
+    if HEDGING_ENABLED and RETRIEVAL_BACKEND != "local":
+        return await hedged(
+            lambda: _aretrieve_index(query, top_k, filters),
+            lambda: aretrieve_pipeline(query, top_k, filters),
+            hedge_delay(),
+            on_primary_done=primary_latency.record,
+        )
+    return await _aretrieve_index(query, top_k, filters)
+
+
+# Cliente HTTP compartilhado para o pipeline endpoint: conexões keep-alive
+# reaproveitadas entre chamadas (sem novo DNS/TCP/TLS a cada tool call).
+HTTP_MAX_CONNECTIONS = int(os.getenv("INDUFIX_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("INDUFIX_HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("INDUFIX_HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_TIMEOUT = float(os.getenv("INDUFIX_HTTP_TIMEOUT", "30"))
+# HTTP/2 só quando o pacote h2 estiver instalado (pip install httpx[http2])
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+
+_http_client = None
+_http_client_loop = None
+# Fechamentos de clientes substituídos em andamento (referência forte)
+_closing_clients: set = set()
+_atexit_registered = False
+
+
+def get_http_client() -> "httpx.AsyncClient":
+    """Retorna o AsyncClient compartilhado do event loop atual."""
+    global _http_client, _http_client_loop, _atexit_registered
+    import httpx
+    loop = asyncio.get_running_loop()
+    # Um AsyncClient fica preso ao loop em que abriu conexões; scripts que
+    # chamam asyncio.run() várias vezes ganham um cliente novo por loop.
+    if _http_client is None or _http_client.is_closed or _http_client_loop is not loop:
+        _discard_http_client(_http_client, _http_client_loop)
+        _http_client = httpx.AsyncClient(
+            http2=HTTP2_ENABLED,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=HTTP_TIMEOUT,
+        )
+        _http_client_loop = loop
+        if not _atexit_registered:
+            atexit.register(_close_http_client_at_exit)
+            _atexit_registered = True
+    return _http_client
+
+
+async def _aclose_quietly(client: "httpx.AsyncClient") -> None:
+    try:
+        await client.aclose()
+    except Exception as e:
+        logger.debug(f"Falha ao fechar cliente HTTP: {e}")
+
+
+def _discard_http_client(client: Any, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+    """Fecha um cliente substituído sem bloquear quem pediu o novo."""
+    if client is None or client.is_closed:
+        return
+    current = asyncio.get_running_loop()
+    if loop is not None and loop is not current and loop.is_running():
+        # O loop dono ainda roda (outra thread): fecha lá
+        asyncio.run_coroutine_threadsafe(_aclose_quietly(client), loop)
+        return
+    task = current.create_task(_aclose_quietly(client))
+    _closing_clients.add(task)
+    task.add_done_callback(_closing_clients.discard)
+
+
+async def aclose_http_client() -> None:
+    """Fecha o cliente compartilhado (chamar no shutdown do servidor)."""
+    global _http_client, _http_client_loop
+    client, _http_client, _http_client_loop = _http_client, None, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+def _close_http_client_at_exit() -> None:
+    # Rede de segurança para quem não chama aclose_http_client no shutdown
+    global _http_client, _http_client_loop
+    client, loop = _http_client, _http_client_loop
+    if client is None or client.is_closed or (loop is not None and loop.is_running()):
+        return
+    _http_client, _http_client_loop = None, None
+    if loop is not None and not loop.is_closed():
+        loop.run_until_complete(_aclose_quietly(client))
+    else:
+        asyncio.run(_aclose_quietly(client))
+
+
+def pipeline_headers() -> Dict[str, str]:
     return {
-        "product_type": product_type,
-        "missing_attributes": missing_attributes,
-        "defaults": defaults
+        "Authorization": f"Bearer {LLAMA_CONFIG['api_key']}",
+        "Content-Type": "application/json"
     }
 
 
-@tool
-async def get_standard_equivalences(standard: str) -> Dict[str, Any]:
-    """
-    Busca equivalências entre normas/padrões técnicos.
-    
-    Args:
-        standard: Norma ou padrão (ex: "DIN 933", "ISO 4017", "ASTM A307")
-    
-    Returns:
-        dict com normas equivalentes e especificações
+class RetrievedNode:
+    """Node de uma resposta raw do pipeline, com a interface usada pelas tools."""
+
+    __slots__ = ("id", "text", "score", "metadata")
+
+    def __init__(self, id: Optional[str], text: str, score: float, metadata: Dict[str, Any]):
+        self.id = id
+        self.text = text
+        self.score = score
+        self.metadata = metadata
+
+
+def pipeline_nodes(payload: Dict[str, Any]) -> List[RetrievedNode]:
+    """Converte a resposta do endpoint /retrieve em nodes."""
+    nodes = []
+    for item in payload.get("retrieval_nodes", []):
+        node = item.get("node", {})
+        nodes.append(RetrievedNode(
+            node.get("id_") or node.get("id"),
+            node.get("text", ""),
+            item.get("score", 1.0),
+            node.get("extra_info") or node.get("metadata") or {},
+        ))
+    return nodes
+
+
+async def aretrieve_pipeline(query: str, top_k: Optional[int] = None, filters: Any = None) -> List[RetrievedNode]:
+    """Rota alternativa: POST direto no PIPELINE_ENDPOINT."""
+    payload: Dict[str, Any] = {"query": query}
+    if top_k is not None:
+        payload["dense_similarity_top_k"] = top_k
+    if filters is not None:
+        payload["search_filters"] = filters.model_dump(mode="json") if hasattr(filters, "model_dump") else filters
+    response = await get_http_client().post(PIPELINE_ENDPOINT, json=payload, headers=pipeline_headers())
+    response.raise_for_status()
+    return pipeline_nodes(response.json())
+
+
+# Hedged retrieval: se o retriever do LlamaCloudIndex não responder até o
+# p95 observado, dispara o PIPELINE_ENDPOINT em paralelo e usa o primeiro
+# que voltar. Corta a cauda (p99) às custas de algumas requisições extras.
+HEDGING_ENABLED = os.getenv("INDUFIX_HEDGING", "").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("INDUFIX_HEDGE_PERCENTILE", "95"))
+HEDGE_INITIAL_DELAY = float(os.getenv("INDUFIX_HEDGE_INITIAL_DELAY", "1.0"))
+HEDGE_MIN_DELAY = float(os.getenv("INDUFIX_HEDGE_MIN_DELAY", "0.05"))
+HEDGE_MIN_SAMPLES = 20
+
+primary_latency = LatencyTracker()
+
+
+def hedge_delay() -> float:
+    """Atraso do hedge: percentil da rota primária (ou o inicial, sem amostras)."""
+    if len(primary_latency) < HEDGE_MIN_SAMPLES:
+        return HEDGE_INITIAL_DELAY
+    return max(HEDGE_MIN_DELAY, primary_latency.percentile(HEDGE_PERCENTILE))
+
+
+# Deadlines por tool e circuit breaker do LlamaCloud: com o upstream
+# degradado, as chamadas falham rápido (ou servem dados vencidos/snapshot)
+# em vez de segurar slots até o timeout de 30 s do HTTP.
+# INDUFIX_TOOL_DEADLINES sobrescreve por tool: "pipeline_retrieve_raw=5,query_indufix_knowledge=30"
+TOOL_DEADLINE = float(os.getenv("INDUFIX_TOOL_DEADLINE", "15"))
+# Síntese (retrieval + geração pelo LLM, inclusive em streaming) leva bem
+# mais que um retrieval: deadline próprio, dimensionado para a geração
+SYNTHESIS_DEADLINE = float(os.getenv("INDUFIX_SYNTHESIS_DEADLINE", "120"))
+TOOL_DEADLINES = {
+    "query_indufix_knowledge": SYNTHESIS_DEADLINE,
+    **{
+        name.strip(): float(seconds)
+        for name, _, seconds in (
+            item.partition("=") for item in os.getenv("INDUFIX_TOOL_DEADLINES", "").split(",") if "=" in item
+        )
+    },
+}
+# Orçamento mínimo (s) para ir ao upstream: quem esperou na fila do limiter
+# até quase o fim do deadline falha localmente, sem contar no breaker
+MIN_CALL_BUDGET = float(os.getenv("INDUFIX_MIN_CALL_BUDGET", "0.25"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("INDUFIX_BREAKER_FAILURES", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("INDUFIX_BREAKER_RESET_TIMEOUT", "30"))
+
+upstream_breaker = CircuitBreaker(
+    failure_threshold=BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=BREAKER_RESET_TIMEOUT,
+)
+# Breaker separado para a síntese: respostas longas ou um LLM lento não
+# abrem o circuito das tools de retrieval com o LlamaCloud saudável
+synthesis_breaker = CircuitBreaker(
+    failure_threshold=BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=BREAKER_RESET_TIMEOUT,
+)
+
+# Limiter compartilhado por todas as tools: token bucket (req/s, 0 = sem
+# teto) + concorrência adaptativa AIMD, que cai pela metade em 429/5xx e
+# volta a subir aos poucos. Retry-After pausa todos os chamadores juntos.
+RATE_LIMIT = float(os.getenv("INDUFIX_RATE_LIMIT", "0"))
+RATE_BURST = int(os.getenv("INDUFIX_RATE_BURST", "10"))
+CONCURRENCY_INITIAL = int(os.getenv("INDUFIX_CONCURRENCY_INITIAL", "8"))
+CONCURRENCY_MIN = int(os.getenv("INDUFIX_CONCURRENCY_MIN", "1"))
+CONCURRENCY_MAX = int(os.getenv("INDUFIX_CONCURRENCY_MAX", "32"))
+
+# Lanes de prioridade: chamadas interativas (chat) passam na frente do bulk
+# (jobs de catálogo); cada lane usa no máximo a fração indicada do limite.
+LANE_CAP_INTERACTIVE = float(os.getenv("INDUFIX_LANE_CAP_INTERACTIVE", "1.0"))
+LANE_CAP_BULK = float(os.getenv("INDUFIX_LANE_CAP_BULK", "0.75"))
+
+upstream_limiter = AdaptiveLimiter(
+    rate=RATE_LIMIT,
+    burst=RATE_BURST,
+    initial_limit=CONCURRENCY_INITIAL,
+    min_limit=CONCURRENCY_MIN,
+    max_limit=CONCURRENCY_MAX,
+    lane_caps={LANE_INTERACTIVE: LANE_CAP_INTERACTIVE, LANE_BULK: LANE_CAP_BULK},
+)
+
+_lane = contextvars.ContextVar("indufix_lane", default=LANE_INTERACTIVE)
+
+
+def current_lane() -> str:
+    return _lane.get()
+
+
+@contextlib.contextmanager
+def priority(lane: str) -> Iterator[None]:
+    """Define a lane das chamadas ao upstream feitas dentro do bloco.
+
+    Ex.: um job de catálogo usa `with priority(LANE_BULK): ...` para não
+    disputar a fila com os chats interativos.
     """
-    query = f"equivalência norma padrão {standard} fastener"
-    nodes = get_retriever().retrieve(query)
-    
-    equivalences = []
-    for node in nodes:
-        equivalences.append({
-            "equivalent_standard": node.metadata.get("equivalent") if hasattr(node, 'metadata') else None,
-            "description": node.text if hasattr(node, 'text') else "",
-            "confidence": node.score if hasattr(node, 'score') else 1.0
-        })
-    
-    return {
-        "standard": standard,
-        "equivalences": equivalences
-    }
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+# Ativo enquanto uma resposta degradada é calculada a partir do snapshot
+_snapshot_fallback = contextvars.ContextVar("indufix_snapshot_fallback", default=False)
+
+
+def tool_deadline(tool_name: str) -> float:
+    return TOOL_DEADLINES.get(tool_name, TOOL_DEADLINE)
+
+
+# Instante (loop.time()) em que vence a tool call em andamento: chamadas
+# internas (ex: o fan-out por atributo) dividem um único deadline
+_call_deadline = contextvars.ContextVar("indufix_call_deadline", default=None)
+
+
+@contextlib.contextmanager
+def tool_call_deadline(tool_name: str) -> Iterator[None]:
+    """Limita todas as chamadas ao upstream do bloco ao deadline de `tool_name`."""
+    deadline = tool_deadline(tool_name)
+    at = asyncio.get_running_loop().time() + deadline if deadline > 0 else None
+    token = _call_deadline.set(at)
+    try:
+        yield
+    finally:
+        _call_deadline.reset(token)
 
 
-@tool
-async def get_confidence_penalty(
-    attribute: str,
-    inferred_value: str,
-    inference_method: str
-) -> Dict[str, Any]:
+def serving_from_snapshot() -> bool:
+    return _snapshot_fallback.get()
+
+
+def snapshot_available() -> bool:
+    from indufix_toolkit.snapshot import MANIFEST_FILE
+    return os.path.exists(os.path.join(SNAPSHOT_PATH, MANIFEST_FILE))
+
+
+async def guarded(
+    tool_name: str,
+    fn: Callable[[], Awaitable[Any]],
+    breaker: Optional[CircuitBreaker] = None,
+) -> Any:
+    """Executa `fn` com o deadline da tool, pelo limiter e pelo circuit breaker.
+
+    O deadline inclui a espera na fila do limiter; só o tempo da chamada em
+    si conta como falha do upstream para o breaker (`upstream_breaker`, se
+    nenhum outro for indicado). Dentro de tool_call_deadline(), vale o que
+    vencer primeiro. Se a fila consumiu o deadline e sobra menos que
+    MIN_CALL_BUDGET, levanta TimeoutError sem chamar o upstream.
     """
-    Obtém penalidade de confiança para valor inferido.
-    
-    Args:
-        attribute: Nome do atributo (ex: "material", "acabamento")
-        inferred_value: Valor inferido (ex: "aço carbono", "zincado")
-        inference_method: Método usado (ex: "default", "pattern_match", "llm")
-    
-    Returns:
-        dict com penalidade sugerida e justificativa
+    breaker = breaker or upstream_breaker
+    breaker.check()
+    deadline = tool_deadline(tool_name)
+    if deadline <= 0:
+        deadline = None
+    lane = current_lane()
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    call_deadline = _call_deadline.get()
+    if call_deadline is not None:
+        outer = max(0.0, call_deadline - started)
+        deadline = outer if deadline is None else min(deadline, outer)
+    await asyncio.wait_for(upstream_limiter.acquire(lane), deadline)
+    try:
+        call = fn
+        if deadline is not None:
+            remaining = deadline - (loop.time() - started)
+            if remaining < MIN_CALL_BUDGET:
+                raise asyncio.TimeoutError(
+                    f"{tool_name}: deadline de {deadline:.2f}s consumido na fila do limiter"
+                )
+            call = lambda: asyncio.wait_for(fn(), remaining)
+        result = await breaker.call(call)
+    except Exception as e:
+        upstream_limiter.on_error(e)
+        raise
+    finally:
+        upstream_limiter.release(lane)
+    upstream_limiter.on_success()
+    return result
+
+
+def _degraded(result: Any, source: str) -> Any:
+    if isinstance(result, dict):
+        return {**result, "degraded": source}
+    return result
+
+
+async def _fallback_result(
+    tool_name: str,
+    key: tuple,
+    compute: Callable[[], Awaitable[Any]],
+    error: Exception,
+) -> Any:
+    """Resposta degradada com o upstream fora: cache vencido ou snapshot local."""
+    if not isinstance(error, CircuitOpenError) and not is_upstream_failure(error):
+        return None
+
+    result = result_cache.get_stale(key)
+    disk_cache = get_disk_cache()
+    if result is None and disk_cache is not None:
+        result = await run_blocking(disk_cache.get_stale, key)
+    if result is not None:
+        logger.warning(f"{tool_name}: upstream indisponível ({error!r}); servindo cache vencido")
+        return _degraded(result, "stale_cache")
+
+    if RETRIEVAL_BACKEND != "local" and snapshot_available():
+        logger.warning(f"{tool_name}: upstream indisponível ({error!r}); servindo do snapshot")
+        token = _snapshot_fallback.set(True)
+        try:
+            return _degraded(await compute(), "snapshot")
+        except Exception as e:
+            logger.warning(f"{tool_name}: fallback via snapshot falhou: {e}")
+        finally:
+            _snapshot_fallback.reset(token)
+    return None
+
+
+# Cache de resultados compartilhado pelas tools de retrieval
+CACHE_MAXSIZE = int(os.getenv("INDUFIX_CACHE_MAXSIZE", "1024"))
+CACHE_TTL = float(os.getenv("INDUFIX_CACHE_TTL", "600"))
+
+result_cache = TTLCache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL)
+
+# Camada persistente opcional (SQLite) atrás da memória; vazio desativa.
+# Namespace = id do pipeline: trocar de índice invalida as entradas antigas.
+DISK_CACHE_PATH = os.getenv("INDUFIX_DISK_CACHE_PATH", "")
+DISK_CACHE_TTL = float(os.getenv("INDUFIX_DISK_CACHE_TTL", "86400"))
+DISK_CACHE_MAX_ENTRIES = int(os.getenv("INDUFIX_DISK_CACHE_MAX_ENTRIES", "50000"))
+
+_disk_cache = None
+
+
+def get_disk_cache() -> Optional[SQLiteCache]:
+    global _disk_cache
+    if _disk_cache is None and DISK_CACHE_PATH:
+        with _init_lock:
+            if _disk_cache is None:
+                _disk_cache = SQLiteCache(
+                    DISK_CACHE_PATH,
+                    namespace=PIPELINE_ID,
+                    ttl=DISK_CACHE_TTL,
+                    max_entries=DISK_CACHE_MAX_ENTRIES,
+                )
+    return _disk_cache
+
+# Chamadas idênticas simultâneas (cache frio) compartilham uma só requisição
+in_flight = SingleFlight()
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    return _WHITESPACE_RE.sub(" ", query).strip().lower()
+
+
+def cache_key(
+    tool_name: str,
+    query: str,
+    top_k: Optional[int] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    index_version: Optional[str] = None,
+    canonical: bool = True,
+) -> tuple:
+    # Consulta canônica: "Parafuso Sextavado M10x1,5 DIN933" e
+    # "parafuso sextavado M10 DIN 933" compartilham a mesma entrada.
+    # Com canonical=False só espaços e caixa são normalizados, para tools
+    # cujo resultado depende do texto exato enviado ao upstream.
+    # A versão do índice na chave impede servir resultados de um índice antigo.
+    filters_key = tuple(sorted(filters.items())) if filters else None
+    query_key = canonical_query(query) if canonical else normalize_query(query)
+    return (index_version, tool_name, query_key, top_k, filters_key)
+
+
+async def cached_call(
+    tool_name: str,
+    query: str,
+    top_k: Optional[int],
+    compute: Callable[[], Awaitable[Any]],
+    filters: Optional[Dict[str, Any]] = None,
+    deadline_name: Optional[str] = None,
+    canonical: bool = True,
+) -> Any:
+    """Serve o resultado do cache ou executa `compute` (uma vez por chave) e armazena.
+
+    `deadline_name` escolhe o deadline (INDUFIX_TOOL_DEADLINES) quando a
+    entrada de cache é parte de outra tool; o default é `tool_name`.
+    `canonical` é repassado a `cache_key`.
     """
-    query = f"penalidade confiança {attribute} {inferred_value} inferido por {inference_method}"
-    nodes = get_retriever().retrieve(query)
-    
-    if nodes and len(nodes) > 0:
-        best_match = nodes[0]
-        return {
-            "attribute": attribute,
-            "inferred_value": inferred_value,
-            "inference_method": inference_method,
-            "suggested_penalty": best_match.metadata.get("penalty", 0.15) if hasattr(best_match, 'metadata') else 0.15,
-            "justification": best_match.text if hasattr(best_match, 'text') else "",
-            "confidence": best_match.score if hasattr(best_match, 'score') else 1.0
-        }
-    
-    return {
-        "attribute": attribute,
-        "inferred_value": inferred_value,
-        "inference_method": inference_method,
-        "suggested_penalty": 0.2,  # default penalty
-        "justification": "Nenhuma regra específica encontrada",
-        "confidence": 0.0
+    key = cache_key(tool_name, query, top_k, filters, await index_version.current(), canonical)
+    cached = result_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async def load():
+        disk_cache = get_disk_cache()
+        if disk_cache is not None:
+            result = await run_blocking(disk_cache.get, key)
+            if result is not None:
+                result_cache.set(key, result)
+                return result
+        try:
+            result = await guarded(deadline_name or tool_name, compute)
+        except Exception as e:
+            fallback = await _fallback_result(tool_name, key, compute, e)
+            if fallback is None:
+                raise
+            return fallback
+        result_cache.set(key, result)
+        if disk_cache is not None:
+            await run_blocking(disk_cache.set, key, result)
+        return result
+
+    return await in_flight.do(key, load)
+
+
+def cache_stats() -> Dict[str, Any]:
+    stats = {
+        **result_cache.stats(),
+        "single_flight": in_flight.stats(),
+        "index_version": index_version.stats(),
+        "circuit_breaker": upstream_breaker.stats(),
+        "synthesis_breaker": synthesis_breaker.stats(),
+        "limiter": upstream_limiter.stats(),
     }
+    if get_disk_cache() is not None:
+        stats["disk"] = get_disk_cache().stats()
+    return stats
 
 
-@tool
-async def pipeline_retrieve_raw(query: str, top_k: int = 5) -> Dict[str, Any]:
-    """
-    Chamada direta ao pipeline endpoint (fallback/debug).
-    
-    Args:
-        query: Query de busca
-        top_k: Número de resultados
-    
-    Returns:
-        dict com resposta raw do pipeline
+# Filtros de metadata aplicados no LlamaCloud (product_type, attribute,
+# rule_kind, ...): a busca vetorial roda só na fatia relevante do índice
+METADATA_FILTERS_ENABLED = os.getenv("INDUFIX_METADATA_FILTERS", "true").lower() in ("1", "true", "yes")
+
+# Valores de rule_kind usados pelas tools
+RULE_KIND_DEFAULT_VALUE = "default_value"
+RULE_KIND_CONFIDENCE_PENALTY = "confidence_penalty"
+
+
+def build_metadata_filters(fields: Dict[str, Any]):
+    """MetadataFilters (igualdade, AND) a partir dos campos não vazios."""
+    fields = {key: value for key, value in fields.items() if value not in (None, "")}
+    if not fields:
+        return None
+    from llama_index.core.vector_stores.types import MetadataFilter, MetadataFilters
+    return MetadataFilters(filters=[
+        MetadataFilter(key=key, value=value) for key, value in sorted(fields.items())
+    ])
+
+
+async def aretrieve_filtered(
+    query: str,
+    top_k: Optional[int] = None,
+    fields: Optional[Dict[str, Any]] = None,
+    widen: bool = True,
+) -> List[Any]:
+    """Busca restrita por metadata; sem resultados, repete sem filtros.
+
+    Com widen=False (filtros pedidos explicitamente pelo chamador) a busca
+    nunca é ampliada: sem resultados na fatia, devolve lista vazia.
     """
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            PIPELINE_ENDPOINT,
-            json={"query": query, "top_k": top_k},
-            headers={
-                "Authorization": f"Bearer {LLAMA_CONFIG['api_key']}",
-                "Content-Type": "application/json"
-            },
-            timeout=30.0
+    if METADATA_FILTERS_ENABLED and fields:
+        filters = build_metadata_filters(fields)
+        if filters is not None:
+            nodes = await aretrieve(query, top_k, filters)
+            if nodes or not widen:
+                return nodes
+    return await aretrieve(query, top_k)
+
+
+# Grafo de equivalências: construído uma vez a partir do metadata do índice.
+# Backend local: lido do snapshot, rápido. Backend cloud: sempre do índice
+# vivo (o snapshot é só o fallback degradado das tools), com o crawl do
+# pipeline (todos os documentos e chunks) numa thread em background, fora do
+# caminho da requisição; até ficar pronto, as consultas caem no retrieval.
+# Cada requisição do crawl passa pela lane bulk do limiter e pelo breaker.
+# Falhas não deixam um grafo vazio: nova tentativa após o intervalo.
+EQUIVALENCE_RETRY_INTERVAL = float(os.getenv("INDUFIX_EQUIVALENCE_RETRY_INTERVAL", "300"))
+
+_equivalence_graph = None
+_equivalence_lock = threading.Lock()
+_equivalence_building = False
+_equivalence_failed_at: Optional[float] = None
+# Incrementada a cada refresh: um build de uma versão antiga não é instalado
+_equivalence_generation = 0
+
+
+def _equivalence_source_nodes(loop: Optional[asyncio.AbstractEventLoop] = None):
+    from indufix_toolkit.snapshot import iter_index_nodes
+    if RETRIEVAL_BACKEND == "local":
+        return get_snapshot().iter_nodes()
+
+    def call(request: Callable[[], Any]) -> Any:
+        async def run():
+            with priority(LANE_BULK):
+                return await guarded("equivalence_crawl", lambda: run_blocking(request))
+        return loop.run_until_complete(run())
+
+    return iter_index_nodes(get_index(), call=call if loop is not None else None)
+
+
+def _build_equivalence_graph(generation: int) -> Optional[EquivalenceGraph]:
+    global _equivalence_graph, _equivalence_building, _equivalence_failed_at
+    # Loop próprio da thread do build: o crawl aguarda o limiter e o breaker
+    loop = asyncio.new_event_loop()
+    try:
+        graph = EquivalenceGraph.from_nodes(_equivalence_source_nodes(loop))
+    except Exception as e:
+        logger.warning(
+            f"Falha ao construir grafo de equivalências "
+            f"(nova tentativa em {EQUIVALENCE_RETRY_INTERVAL:.0f}s): {e}"
         )
-        response.raise_for_status()
-        return response.json()
-
-
-# Lista de tools exportadas
-TOOLS = [
-    retrieve_matching_rules,
-    query_indufix_knowledge,
-    get_default_values,
-    get_standard_equivalences,
-    get_confidence_penalty,
-    pipeline_retrieve_raw,
-]
+        graph = None
+    finally:
+        loop.close()
+    with _equivalence_lock:
+        if generation != _equivalence_generation:
+            return graph
+        _equivalence_building = False
+        if graph is None:
+            _equivalence_failed_at = time.monotonic()
+        else:
+            _equivalence_graph = graph
+            _equivalence_failed_at = None
+    return graph
+
+
+def get_equivalence_graph() -> Optional[EquivalenceGraph]:
+    """Grafo pronto, ou None enquanto não existe (consultas usam o retrieval)."""
+    global _equivalence_building
+    if _equivalence_graph is not None:
+        return _equivalence_graph
+    with _equivalence_lock:
+        if _equivalence_graph is not None:
+            return _equivalence_graph
+        if _equivalence_building:
+            return None
+        if (
+            _equivalence_failed_at is not None
+            and time.monotonic() - _equivalence_failed_at < EQUIVALENCE_RETRY_INTERVAL
+        ):
+            return None
+        _equivalence_building = True
+        generation = _equivalence_generation
+
+    if RETRIEVAL_BACKEND == "local":
+        return _build_equivalence_graph(generation)
+    threading.Thread(
+        target=_build_equivalence_graph,
+        args=(generation,),
+        name="indufix-equivalences",
+        daemon=True,
+    ).start()
+    return None
+
+
+def refresh_equivalence_graph() -> None:
+    """Descarta o grafo; a próxima consulta reconstrói a partir do índice."""
+    global _equivalence_graph, _equivalence_building, _equivalence_failed_at, _equivalence_generation
+    with _equivalence_lock:
+        _equivalence_graph = None
+        _equivalence_building = False
+        _equivalence_failed_at = None
+        _equivalence_generation += 1
+
+
+async def aget_equivalence_graph() -> Optional[EquivalenceGraph]:
+    if _equivalence_graph is not None:
+        return _equivalence_graph
+    return await run_blocking(get_equivalence_graph)
+
+
+# Versão do índice: sonda barata (metadata do pipeline) no máximo uma vez
+# por intervalo; 0 desativa. Mudou a versão, os caches deixam de valer.
+INDEX_VERSION_INTERVAL = float(os.getenv("INDUFIX_INDEX_VERSION_INTERVAL", "60"))
+# Espera máxima (s) pela primeira sonda; depois vale a última versão conhecida
+INDEX_VERSION_TIMEOUT = float(os.getenv("INDUFIX_INDEX_VERSION_TIMEOUT", "2"))
+
+# A última versão vista fica no cache em disco: após um restart durante uma
+# queda do LlamaCloud, as entradas gravadas continuam endereçáveis
+_INDEX_VERSION_KEY = ("__index_version__",)
+
+
+async def probe_index_version() -> str:
+    if RETRIEVAL_BACKEND == "local":
+        manifest = get_snapshot().manifest
+        return f"snapshot:{manifest.get('pipeline_id')}:{manifest.get('exported_at')}"
+    upstream_breaker.check()
+    index = await aget_index()
+    pipelines = index._aclient.pipelines
+    pipeline, status = await asyncio.gather(
+        pipelines.get_pipeline(index.pipeline.id),
+        pipelines.get_pipeline_status(index.pipeline.id),
+    )
+    version = _index_version(pipeline, status)
+    disk_cache = get_disk_cache()
+    if disk_cache is not None:
+        await run_blocking(disk_cache.set, _INDEX_VERSION_KEY, version)
+    return version
+
+
+def probe_index_version_sync() -> str:
+    """Mesma sonda pelo cliente síncrono (warm-up, fora de um event loop)."""
+    if RETRIEVAL_BACKEND == "local":
+        manifest = get_snapshot().manifest
+        return f"snapshot:{manifest.get('pipeline_id')}:{manifest.get('exported_at')}"
+    index = get_index()
+    pipelines = index._client.pipelines
+    version = _index_version(
+        pipelines.get_pipeline(index.pipeline.id),
+        pipelines.get_pipeline_status(index.pipeline.id),
+    )
+    disk_cache = get_disk_cache()
+    if disk_cache is not None:
+        disk_cache.set(_INDEX_VERSION_KEY, version)
+    return version
+
+
+def _index_version(pipeline: Any, status: Any) -> str:
+    # updated_at muda com a configuração; effective_at/job_id a cada ingestão
+    return f"{pipeline.updated_at}|{status.effective_at}|{status.job_id}"
+
+
+async def last_known_index_version() -> Optional[str]:
+    disk_cache = get_disk_cache()
+    if disk_cache is None:
+        return None
+    return await run_blocking(disk_cache.get_stale, _INDEX_VERSION_KEY)
+
+
+def _on_index_version_change(previous: Optional[str], version: str) -> None:
+    result_cache.clear()
+    refresh_equivalence_graph()
+
+
+index_version = IndexVersionMonitor(
+    probe_index_version,
+    interval=INDEX_VERSION_INTERVAL,
+    timeout=INDEX_VERSION_TIMEOUT,
+    last_known=last_known_index_version,
+)
+index_version.add_listener(_on_index_version_change)
+
+
+# Tools carregadas sob demanda (PEP 562): importar o pacote não puxa langchain_core
+_TOOL_NAMES = (
+    "retrieve_matching_rules",
+    "retrieve_matching_rules_batch",
+    "query_indufix_knowledge",
+    "get_default_values",
+    "get_standard_equivalences",
+    "get_confidence_penalty",
+    "pipeline_retrieve_raw",
+)
+
+
+def __getattr__(name: str) -> Any:
+    if name == "TOOLS" or name in _TOOL_NAMES:
+        from indufix_toolkit import tools
+        return getattr(tools, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Warm-up opcional: constrói índice, retrievers, query engine e grafo de
+# equivalências e consulta a versão do índice em background, para que nenhum
+# usuário pague o cold start.
+# Ative com INDUFIX_WARMUP=1 (o servidor LangGraph importa o toolkit no boot).
+WARMUP_ON_IMPORT = os.getenv("INDUFIX_WARMUP", "").lower() in ("1", "true", "yes")
+WARMUP_PROBE_QUERY = os.getenv("INDUFIX_WARMUP_PROBE_QUERY")
+
+# top_k usados pelas tools: get_standard_equivalences (None),
+# get_confidence_penalty (1), get_default_values (3) e o default de
+# retrieve_matching_rules (5). Filtros não criam retrievers novos.
+WARMUP_TOP_KS = (None, 1, 3, 5)
+
+_warm_up_thread = None
+
+
+def warm_up(probe_query: Optional[str] = None) -> None:
+    """Inicializa os recursos do toolkit; erros são registrados, não lançados."""
+    try:
+        for top_k in WARMUP_TOP_KS:
+            get_retriever(top_k)
+        if RETRIEVAL_BACKEND != "local":
+            get_query_engine()
+        get_equivalence_graph()
+        if INDEX_VERSION_INTERVAL > 0:
+            index_version.update(probe_index_version_sync())
+        if probe_query:
+            get_retriever(WARMUP_TOP_KS[-1]).retrieve(probe_query)
+        logger.info("Warm-up do indufix_toolkit concluído")
+    except Exception as e:
+        logger.warning(f"Warm-up do indufix_toolkit falhou: {e}")
+
+
+async def awarm_up(probe_query: Optional[str] = None) -> None:
+    """warm_up() mais os recursos presos ao event loop atual.
+
+    Para servidores com hook de startup: além do warm_up() (no executor),
+    abre a conexão keep-alive do cliente HTTP compartilhado deste loop e
+    dispara a sonda de versão do índice.
+    """
+    await run_blocking(warm_up, probe_query)
+    try:
+        await index_version.current()
+        if RETRIEVAL_BACKEND != "local":
+            origin = re.match(r"https?://[^/]+", PIPELINE_ENDPOINT).group(0)
+            await get_http_client().head(origin)
+    except Exception as e:
+        logger.warning(f"Warm-up do cliente HTTP falhou: {e}")
+
+
+def start_warm_up(probe_query: Optional[str] = None) -> threading.Thread:
+    """Dispara warm_up() em uma thread daemon (uma única vez por processo)."""
+    global _warm_up_thread
+    with _init_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(
+                target=warm_up,
+                args=(probe_query,),
+                name="indufix-warm-up",
+                daemon=True,
+            )
+            _warm_up_thread.start()
+    return _warm_up_thread
+
+
+if WARMUP_ON_IMPORT:
+    start_warm_up(WARMUP_PROBE_QUERY)
@@ -0,0 +1,261 @@
+"""Caches das tools de retrieval: memória (LRU + TTL), SQLite e single-flight"""
+import asyncio
+import copy
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Cache LRU limitado por tamanho, com expiração por entrada.
+
+    Valores são copiados na leitura e na escrita, então quem chama pode
+    modificar o resultado sem corromper a entrada compartilhada. Entradas
+    vencidas continuam ocupando espaço até a evicção LRU, para que
+    `get_stale` possa servi-las quando o upstream estiver fora.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(value)
+
+    def get_stale(self, key: Hashable, default: Any = None) -> Any:
+        """Valor da entrada mesmo vencido (resposta degradada)."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        return copy.deepcopy(entry[1])
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class SingleFlight:
+    """Coalesce chamadas concorrentes idênticas em uma única execução.
+
+    A primeira chamada para uma chave dispara `fn` como task; as demais que
+    chegam enquanto ela está em voo aguardam a mesma task. O cancelamento
+    de um chamador não cancela a execução compartilhada.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, "asyncio.Task"] = {}
+        self.executions = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        task = self._calls.get(key)
+        if task is not None and task.get_loop() is loop:
+            self.shared += 1
+            return copy.deepcopy(await asyncio.shield(task))
+
+        task = loop.create_task(fn())
+        self._calls[key] = task
+        self.executions += 1
+
+        def _done(finished: "asyncio.Task") -> None:
+            if self._calls.get(key) is finished:
+                del self._calls[key]
+            # Marca a exceção como consumida mesmo se todos cancelaram
+            if not finished.cancelled():
+                finished.exception()
+
+        task.add_done_callback(_done)
+        return await asyncio.shield(task)
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._calls),
+            "executions": self.executions,
+            "shared": self.shared,
+        }
+
+
+class SQLiteCache:
+    """Camada persistente (SQLite) atrás do cache em memória.
+
+    Sobrevive a restarts e redeploys do worker. As entradas ficam em um
+    namespace (ex: o id do pipeline); ao abrir com outro namespace, as
+    entradas antigas são descartadas. WAL permite leitores concorrentes
+    entre threads e processos; cada thread usa sua própria conexão.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        namespace: str,
+        ttl: float = 86400.0,
+        max_entries: int = 50000,
+    ):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+        conn = self._connection()
+        with self._write_lock, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_created ON entries (namespace, created_at)")
+            # Novo pipeline/índice: entradas de outros namespaces não valem mais
+            conn.execute("DELETE FROM entries WHERE namespace != ?", (namespace,))
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _key(key: Hashable) -> str:
+        return json.dumps(key, ensure_ascii=False, default=str)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ?",
+            (self.namespace, self._key(key)),
+        ).fetchone()
+        if row is None or row[1] <= time.time():
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(row[0])
+
+    def get_stale(self, key: Hashable, default: Any = None) -> Any:
+        """Valor da entrada mesmo vencido, se ainda não foi limpo."""
+        row = self._connection().execute(
+            "SELECT value FROM entries WHERE namespace = ? AND key = ?",
+            (self.namespace, self._key(key)),
+        ).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if self.max_entries <= 0:
+            return
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        data = json.dumps(value, ensure_ascii=False, default=str)
+        conn = self._connection()
+        with self._write_lock, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, created_at, expires_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, self._key(key), data, now, expires_at),
+            )
+            self._writes += 1
+            # Limpeza amortizada: a cada 100 escritas, expiradas e excedentes
+            if self._writes % 100 == 0:
+                self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute(
+            "DELETE FROM entries WHERE namespace = ? AND expires_at <= ?",
+            (self.namespace, now),
+        )
+        (count,) = conn.execute(
+            "SELECT COUNT(*) FROM entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        if count > self.max_entries:
+            # Remove as mais antigas (FIFO); leituras não escrevem no disco
+            conn.execute(
+                "DELETE FROM entries WHERE namespace = ? AND key IN ("
+                " SELECT key FROM entries WHERE namespace = ?"
+                " ORDER BY created_at ASC LIMIT ?)",
+                (self.namespace, self.namespace, count - self.max_entries),
+            )
+
+    def clear(self) -> None:
+        conn = self._connection()
+        with self._write_lock, conn:
+            conn.execute("DELETE FROM entries WHERE namespace = ?", (self.namespace,))
+
+    def __len__(self) -> int:
+        (count,) = self._connection().execute(
+            "SELECT COUNT(*) FROM entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "path": self.path,
+            "namespace": self.namespace,
+            "size": len(self),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
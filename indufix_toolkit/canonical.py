@@ -0,0 +1,220 @@
+"""Parser de especificações de fixadores e canonicalização de consultas
+
+Extrai rosca, passo, comprimento, norma, tipo de produto, classe, material e
+acabamento de textos livres, com padrões pré-compilados:
+
+    >>> canonicalize("parafuso sextavado M10x1,5 DIN933 zincado")[0]
+    'parafuso sextavado M10 DIN 933 zincado'
+
+A consulta canônica é usada como chave de cache e de deduplicação; o
+FastenerSpec alimenta filtros de metadata. Resultados ficam em lru_cache
+para volume de catálogo (milhares de strings por segundo).
+"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+
+from indufix_toolkit.equivalences import STANDARD_RE, normalize_standard
+
+# Passo grosso ISO (métrico): M10 e M10x1,5 são a mesma rosca
+COARSE_PITCH = {
+    1.6: 0.35, 2: 0.4, 2.5: 0.45, 3: 0.5, 4: 0.7, 5: 0.8, 6: 1.0, 8: 1.25,
+    10: 1.5, 12: 1.75, 14: 2.0, 16: 2.0, 18: 2.5, 20: 2.5, 22: 2.5, 24: 3.0,
+    27: 3.0, 30: 3.5, 33: 3.5, 36: 4.0, 39: 4.0, 42: 4.5, 45: 4.5, 48: 5.0,
+}
+
+# (padrão sobre texto minúsculo e sem acentos, valor canônico) - ordem importa:
+# padrões mais específicos primeiro
+_PRODUCT_TYPES = [
+    (r"parafusos?\s+(?:de\s+)?(?:cabeca\s+)?sextavad[oa]s?|hex(?:agon)?\s+bolts?", "parafuso_sextavado"),
+    (r"parafusos?\s+(?:de\s+)?(?:cabeca\s+)?cilindric[oa]s?|parafusos?\s+allen|socket\s+head", "parafuso_allen"),
+    (r"parafusos?\s+(?:auto\s*)?atarraxantes?|self\s+tapping", "parafuso_atarraxante"),
+    (r"parafusos?\s+frances(?:es)?|carriage\s+bolts?", "parafuso_frances"),
+    (r"parafusos?|bolts?|screws?", "parafuso"),
+    (r"porcas?\s+(?:auto\s*)?travantes?|lock\s*nuts?", "porca_autotravante"),
+    (r"porcas?(?:\s+sextavadas?)?|(?:hex\s+)?nuts?", "porca"),
+    (r"arruelas?\s+(?:de\s+)?pressao|lock\s+washers?", "arruela_pressao"),
+    (r"arruelas?\s+lisas?|flat\s+washers?", "arruela_lisa"),
+    (r"arruelas?|washers?", "arruela"),
+    (r"barras?\s+roscadas?|threaded\s+rods?", "barra_roscada"),
+    (r"prisioneiros?|studs?", "prisioneiro"),
+    (r"chumbadores?|anchors?", "chumbador"),
+    (r"rebites?|rivets?", "rebite"),
+]
+
+_MATERIALS = [
+    (r"(?:aco\s+)?inox(?:idavel)?(?:\s+(?:aisi\s+)?(304|316|410|420))?|stainless(?:\s+steel)?", "aco_inox"),
+    (r"aco\s+liga|alloy\s+steel", "aco_liga"),
+    # "aço" sozinho é ambíguo (carbono, inox, liga): fica no texto residual
+    (r"aco\s+carbono|carbon\s+steel", "aco_carbono"),
+    (r"latao|brass", "latao"),
+    (r"aluminio|aluminum", "aluminio"),
+    (r"nylon|poliamida", "nylon"),
+]
+
+_FINISHES = [
+    (r"zincad[oa]s?(?:\s+(?:branco|azul|amarelo|preto))?|zinc\s+plated", "zincado"),
+    (r"galvanizad[oa]s?(?:\s+a\s+fogo)?|hot\s+dip", "galvanizado"),
+    (r"bicromatizad[oa]s?", "bicromatizado"),
+    (r"fosfatizad[oa]s?", "fosfatizado"),
+    (r"oxidad[oa]s?(?:\s+pret[oa])?|black\s+oxide", "oxidado"),
+    (r"geomet|organometalico", "geomet"),
+    (r"polid[oa]s?", "polido"),
+    (r"natural|sem\s+acabamento|plain", "natural"),
+]
+
+
+def _alternation(entries):
+    return [(re.compile(r"\b(?:%s)\b" % pattern), value) for pattern, value in entries]
+
+
+_PRODUCT_TYPE_RES = _alternation(_PRODUCT_TYPES)
+_MATERIAL_RES = _alternation(_MATERIALS)
+_FINISH_RES = _alternation(_FINISHES)
+
+# M10, M10x1,5, M10 x 1.25 x 30, M8X40
+_THREAD_RE = re.compile(
+    r"\bm\s?(\d+(?:[.,]\d+)?)((?:\s*[x×]\s*\d+(?:[.,]\d+)?){0,2})\b"
+)
+_DIMENSION_RE = re.compile(r"[x×]\s*(\d+(?:[.,]\d+)?)")
+# Classe de resistência de parafusos: 4.6, 5.8, 8.8, 10.9, 12.9
+_PROPERTY_CLASS_RE = re.compile(r"\b(?:classe\s+)?(4\.6|4\.8|5\.6|5\.8|6\.8|8\.8|10\.9|12\.9)\b")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _max_pitch(diameter: float) -> float:
+    """Maior passo possível para o diâmetro: o grosso (passos finos são menores).
+
+    Diâmetros fora da tabela usam ~20% do diâmetro, acima de qualquer passo real.
+    """
+    return COARSE_PITCH.get(diameter, diameter * 0.2)
+
+
+class FastenerSpec(NamedTuple):
+    """Chave estruturada de uma especificação de fixador (hashable)."""
+
+    product_type: Optional[str] = None
+    thread: Optional[str] = None
+    pitch: Optional[float] = None
+    length: Optional[float] = None
+    standards: Tuple[str, ...] = ()
+    property_class: Optional[str] = None
+    material: Optional[str] = None
+    finish: Optional[str] = None
+
+    @property
+    def is_empty(self) -> bool:
+        return not any(self)
+
+
+def fold(text: str) -> str:
+    """Minúsculas e sem acentos ("Aço Zincado" -> "aco zincado")."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def _number(value: str) -> float:
+    number = float(value.replace(",", "."))
+    return int(number) if number.is_integer() else number
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else f"{value:g}"
+
+
+def _take(patterns, text: str):
+    """Primeiro padrão que casa: (valor, match, texto com o trecho removido)."""
+    for regex, value in patterns:
+        match = regex.search(text)
+        if match:
+            return value, match, text[:match.start()] + " " + text[match.end():]
+    return None, None, text
+
+
+@lru_cache(maxsize=8192)
+def split_query(query: str) -> Tuple[FastenerSpec, str]:
+    """Retorna (FastenerSpec, texto residual não reconhecido) para um texto livre."""
+    # "parafuso_sextavado" (forma usada nos argumentos das tools) = "parafuso sextavado"
+    text = fold(query).replace("_", " ")
+
+    standards = tuple(sorted({normalize_standard(code) for code in STANDARD_RE.findall(text)}))
+    text = STANDARD_RE.sub(" ", text)
+
+    thread = pitch = length = None
+    match = _THREAD_RE.search(text)
+    if match:
+        diameter = _number(match.group(1))
+        thread = f"M{_format_number(diameter)}"
+        for dimension in _DIMENSION_RE.findall(match.group(2)):
+            value = _number(dimension)
+            # M10x1,25 é passo; M3x6 e M10x30 são comprimento
+            if pitch is None and length is None and value <= _max_pitch(diameter):
+                pitch = value
+            else:
+                length = value
+        if pitch is None:
+            pitch = COARSE_PITCH.get(diameter)
+        text = text[:match.start()] + " " + text[match.end():]
+
+    property_class = None
+    match = _PROPERTY_CLASS_RE.search(text)
+    if match:
+        property_class = match.group(1)
+        text = text[:match.start()] + " " + text[match.end():]
+
+    product_type, _, text = _take(_PRODUCT_TYPE_RES, text)
+    material, match, text = _take(_MATERIAL_RES, text)
+    if material == "aco_inox" and match.lastindex:
+        material = f"aco_inox_{match.group(match.lastindex)}"
+    finish, _, text = _take(_FINISH_RES, text)
+
+    spec = FastenerSpec(
+        product_type=product_type,
+        thread=thread,
+        pitch=pitch,
+        length=length,
+        standards=standards,
+        property_class=property_class,
+        material=material,
+        finish=finish,
+    )
+    return spec, _WHITESPACE_RE.sub(" ", text).strip()
+
+
+@lru_cache(maxsize=8192)
+def canonicalize(query: str) -> Tuple[str, FastenerSpec]:
+    """Retorna (consulta canônica, FastenerSpec) para um texto livre."""
+    spec, residual = split_query(query)
+    product_type, thread, pitch, length, standards, property_class, material, finish = spec
+
+    parts = []
+    if product_type:
+        parts.append(product_type.replace("_", " "))
+    if thread:
+        token = thread
+        # Passo grosso fica implícito: "M10" e "M10x1,5" geram a mesma chave
+        if pitch is not None and pitch != COARSE_PITCH.get(_number(thread[1:])):
+            token += f"x{_format_number(pitch)}"
+        if length is not None:
+            token += f"x{_format_number(length)}"
+        parts.append(token)
+    parts.extend(standards)
+    if property_class:
+        parts.append(f"classe {property_class}")
+    if material:
+        parts.append(material.replace("_", " "))
+    if finish:
+        parts.append(finish)
+    if residual:
+        parts.append(residual)
+
+    return " ".join(parts), spec
+
+
+def canonical_query(query: str) -> str:
+    return canonicalize(query)[0]
+
+
+def parse_spec(query: str) -> FastenerSpec:
+    return canonicalize(query)[1]
@@ -0,0 +1,137 @@
+"""Grafo de equivalências entre normas (DIN 933 <-> ISO 4017 <-> ...)
+
+Construído a partir do metadata `equivalent` dos nodes do índice, com
+union-find sobre códigos normalizados. Cada classe de equivalência é
+materializada uma vez, então a consulta é um lookup O(1) e já inclui
+equivalências transitivas (DIN -> ISO -> ASTM).
+"""
+import re
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set
+
+# Prefixos de normas reconhecidos no texto dos nodes
+STANDARD_PREFIXES = ("DIN", "ISO", "ASTM", "ANSI", "ASME", "SAE", "NBR", "ABNT", "EN", "JIS", "BS", "UNI", "GB")
+
+_GLUED_RE = re.compile(r"\b([A-Z]{2,5})(?=\d)")
+_YEAR_RE = re.compile(r":\s*\d{4}$")
+STANDARD_RE = re.compile(
+    r"\b(?:%s)(?:\s+(?:EN|ISO))*[\s\-_]*[A-Z]?\d+(?:[.\-]\d+)?\b" % "|".join(STANDARD_PREFIXES),
+    re.IGNORECASE,
+)
+
+# Chaves de metadata que identificam a norma do próprio node
+_SOURCE_KEYS = ("standard", "norma")
+
+
+def normalize_standard(code: str) -> str:
+    """Forma canônica de um código de norma ("din-933" -> "DIN 933")."""
+    code = code.strip().upper().replace("_", " ").replace("-", " ")
+    code = _YEAR_RE.sub("", code)
+    code = _GLUED_RE.sub(r"\1 ", code)
+    return " ".join(code.split())
+
+
+def find_standards(text: str) -> List[str]:
+    """Códigos de norma mencionados em um texto, já normalizados."""
+    return [normalize_standard(match) for match in STANDARD_RE.findall(text or "")]
+
+
+def _split_codes(value: Any) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        items = [str(item) for item in value]
+    else:
+        items = re.split(r"[,;/]|\s+[=≡]\s+", str(value))
+    return [normalize_standard(item) for item in items if item.strip()]
+
+
+class EquivalenceGraph:
+    """Union-find de normas, com as classes materializadas para lookup O(1)."""
+
+    def __init__(self):
+        self._parent: Dict[str, str] = {}
+        self._neighbors: Dict[str, Set[str]] = {}
+        self._groups: Dict[str, FrozenSet[str]] = {}
+        self._dirty = False
+
+    def _find(self, code: str) -> str:
+        parent = self._parent.setdefault(code, code)
+        while parent != self._parent[parent]:
+            # Path halving
+            self._parent[parent] = self._parent[self._parent[parent]]
+            parent = self._parent[parent]
+        self._parent[code] = parent
+        return parent
+
+    def add(self, a: str, b: str) -> None:
+        a, b = normalize_standard(a), normalize_standard(b)
+        if not a or not b or a == b:
+            return
+        self._neighbors.setdefault(a, set()).add(b)
+        self._neighbors.setdefault(b, set()).add(a)
+        root_a, root_b = self._find(a), self._find(b)
+        if root_a != root_b:
+            self._parent[root_b] = root_a
+        self._dirty = True
+
+    def add_node(self, text: str, metadata: Dict[str, Any]) -> None:
+        """Registra as equivalências declaradas em um node do índice."""
+        equivalents = _split_codes(metadata.get("equivalent"))
+        if not equivalents:
+            return
+        sources = []
+        for key in _SOURCE_KEYS:
+            sources.extend(_split_codes(metadata.get(key)))
+        if not sources:
+            # Sem metadata da norma de origem: usa a primeira citada no texto
+            sources = [code for code in find_standards(text) if code not in equivalents][:1]
+        for source in sources:
+            for equivalent in equivalents:
+                self.add(source, equivalent)
+
+    def _materialize(self) -> None:
+        groups: Dict[str, Set[str]] = {}
+        for code in self._parent:
+            groups.setdefault(self._find(code), set()).add(code)
+        self._groups = {}
+        for members in groups.values():
+            frozen = frozenset(members)
+            for code in members:
+                self._groups[code] = frozen
+        self._dirty = False
+
+    def __contains__(self, code: str) -> bool:
+        if self._dirty:
+            self._materialize()
+        return normalize_standard(code) in self._groups
+
+    def __len__(self) -> int:
+        return len(self._parent)
+
+    def equivalents(self, code: str) -> Optional[List[Dict[str, Any]]]:
+        """Equivalentes de `code` (sem ele mesmo) ou None se desconhecido."""
+        if self._dirty:
+            self._materialize()
+        code = normalize_standard(code)
+        group = self._groups.get(code)
+        if group is None:
+            return None
+        direct = self._neighbors.get(code, set())
+        return [
+            {"standard": other, "transitive": other not in direct}
+            for other in sorted(group)
+            if other != code
+        ]
+
+    @classmethod
+    def from_nodes(cls, nodes: Iterable[Any]) -> "EquivalenceGraph":
+        """Constrói o grafo a partir de nodes ({text, metadata} ou objetos)."""
+        graph = cls()
+        for node in nodes:
+            if isinstance(node, dict):
+                text, metadata = node.get("text", ""), node.get("metadata") or {}
+            else:
+                text, metadata = getattr(node, "text", ""), getattr(node, "metadata", {}) or {}
+            graph.add_node(text, metadata)
+        graph._materialize()
+        return graph
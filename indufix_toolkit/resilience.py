@@ -0,0 +1,451 @@
+"""Controles de latência e falha para as chamadas ao LlamaCloud
+
+- LatencyTracker: janela móvel de latências com percentis
+- hedged(): dispara a rota secundária se a primária passar do atraso e
+  fica com a primeira resposta, cancelando a outra
+- CircuitBreaker: após falhas consecutivas do upstream, rejeita chamadas na
+  hora (fail fast) e, passado o intervalo, deixa passar uma sonda (half-open)
+- AdaptiveLimiter: token bucket (req/s) + limite de concorrência AIMD,
+  reduzido em 429/5xx e recuperado aos poucos, com lanes de prioridade
+  (interativo na frente do bulk)
+"""
+import asyncio
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class LatencyTracker:
+    """Janela móvel das últimas latências (segundos) de uma rota."""
+
+    def __init__(self, window: int = 200):
+        self._samples: "deque[float]" = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))
+        return samples[index]
+
+
+async def hedged(
+    primary: Callable[[], Awaitable[Any]],
+    secondary: Callable[[], Awaitable[Any]],
+    delay: float,
+    on_primary_done: Optional[Callable[[float], None]] = None,
+) -> Any:
+    """Executa `primary`; após `delay` sem resposta, dispara `secondary` também.
+
+    Retorna o primeiro resultado bem-sucedido e cancela a chamada perdedora.
+    Se a primária falhar antes do atraso, a secundária é disparada na hora.
+    `on_primary_done(elapsed)` recebe a latência da primária (ou o tempo até
+    o cancelamento, um limite inferior) para alimentar o percentil.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    first = loop.create_task(primary())
+    if on_primary_done is not None:
+        first.add_done_callback(lambda _: on_primary_done(loop.time() - started))
+
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done and not first.exception():
+            return first.result()
+
+        tasks.add(loop.create_task(secondary()))
+        error: Optional[BaseException] = None
+        pending = {task for task in tasks if not task.done()}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error if error is not None else first.exception()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+class CircuitOpenError(RuntimeError):
+    """Chamada rejeitada sem ir ao upstream: o circuito está aberto."""
+
+
+def upstream_status(error: BaseException) -> Optional[int]:
+    """Status HTTP de um erro do httpx/cliente LlamaCloud, se houver."""
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is None:
+        status = getattr(error, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Header Retry-After (em segundos) da resposta de um erro, se houver."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_overload(error: BaseException) -> bool:
+    """O upstream pediu para desacelerar (429) ou está sobrecarregado (5xx)."""
+    status = upstream_status(error)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def _is_transport_error(error: BaseException) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError, OSError)):
+        return True
+    # Sem httpx carregado não há como a exceção ser dele (import continua lazy)
+    httpx = sys.modules.get("httpx")
+    return httpx is not None and isinstance(error, (httpx.TransportError, httpx.TimeoutException))
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """Falhas que indicam upstream degradado (timeout, conexão, 429, 5xx).
+
+    Erros 4xx do cliente (query inválida, 404) não contam: o serviço
+    respondeu. Bugs locais e respostas malformadas (KeyError, ValueError,
+    erros de validação) também não: precisam aparecer, não virar
+    resposta degradada.
+    """
+    status = upstream_status(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return _is_transport_error(error)
+
+
+class CircuitBreaker:
+    """Circuit breaker closed -> open -> half-open por falhas consecutivas."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Reserva a passagem de uma chamada (ou de uma sonda, em half-open)."""
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._probes = 0
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probes = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probes = 0
+                self.trips += 1
+
+    def _release(self) -> None:
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def check(self) -> None:
+        """Fail fast sem reservar sonda: CircuitOpenError se estiver aberto."""
+        if self.state == self.OPEN:
+            with self._lock:
+                self.rejected += 1
+            raise CircuitOpenError("LlamaCloud indisponível (circuit breaker aberto)")
+
+    async def call(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Executa `fn` pelo circuito; CircuitOpenError se estiver aberto."""
+        if not self.allow():
+            raise CircuitOpenError("LlamaCloud indisponível (circuit breaker aberto)")
+        try:
+            result = await fn()
+        except Exception as e:
+            if is_upstream_failure(e):
+                self.record_failure()
+            elif upstream_status(e) is not None:
+                # 4xx: o upstream respondeu
+                self.record_success()
+            else:
+                # Erro local: não diz nada sobre o upstream, só libera a sonda
+                self._release()
+            raise
+        except BaseException:
+            # Cancelamento não diz nada sobre o upstream: só libera a sonda
+            self._release()
+            raise
+        self.record_success()
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+# Lanes de prioridade, da mais para a menos prioritária
+LANE_INTERACTIVE = "interactive"
+LANE_BULK = "bulk"
+LANES = (LANE_INTERACTIVE, LANE_BULK)
+
+
+class AdaptiveLimiter:
+    """Token bucket + concorrência AIMD compartilhados pelas chamadas ao upstream.
+
+    - Token bucket: no máximo `rate` requisições/s, com rajadas de `burst`
+      (rate <= 0 desativa). Um 429 com Retry-After pausa o bucket inteiro,
+      então todos os chamadores recuam juntos em vez de martelar o upstream.
+    - AIMD: o limite de requisições simultâneas cresce +1 a cada `limit`
+      sucessos e cai pela metade em 429/5xx (no máximo uma vez por
+      `decrease_interval`, para uma rajada de erros contar como um sinal só).
+    - Lanes: a fila é por prioridade (LANES); um slot livre vai sempre para
+      a lane mais prioritária com espera, e cada lane usa no máximo a fração
+      `lane_caps[lane]` do limite. Assim o bulk ocupa a capacidade ociosa sem
+      empurrar o p95 das chamadas interativas.
+
+    Os waiters são futures do loop de cada chamador, acordados com
+    call_soon_threadsafe: o limiter pode ser compartilhado entre loops.
+    """
+
+    def __init__(
+        self,
+        rate: float = 0.0,
+        burst: int = 10,
+        initial_limit: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        backoff: float = 0.5,
+        decrease_interval: float = 1.0,
+        lane_caps: Optional[Dict[str, float]] = None,
+    ):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.backoff = backoff
+        self.decrease_interval = decrease_interval
+        self.lane_caps = {lane: 1.0 for lane in LANES}
+        self.lane_caps.update(lane_caps or {})
+        self._limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self._lock = threading.Lock()
+        self._waiters: Dict[str, "deque[asyncio.Future]"] = {lane: deque() for lane in LANES}
+        self._in_flight = 0
+        self._lane_in_flight = {lane: 0 for lane in LANES}
+        self._waiting_tokens = {lane: 0 for lane in LANES}
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._decreased_at = 0.0
+        self.throttled = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def queued(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values()) + sum(self._waiting_tokens.values())
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def lane_limit(self, lane: str) -> int:
+        return max(1, int(self._limit * self.lane_caps[lane]))
+
+    def _can_start(self, lane: str) -> bool:
+        return self._in_flight < self.limit and self._lane_in_flight[lane] < self.lane_limit(lane)
+
+    def _ahead(self, lane: str) -> bool:
+        """Há espera na própria lane ou numa mais prioritária."""
+        for other in LANES:
+            if self._waiters[other]:
+                return True
+            if other == lane:
+                return False
+        return False
+
+    async def acquire(self, lane: str = LANE_INTERACTIVE) -> None:
+        """Aguarda um slot de concorrência e um token; par de `release(lane)`."""
+        if lane not in self._waiters:
+            raise ValueError(f"Lane desconhecida: {lane!r} (use uma de {LANES})")
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._can_start(lane) and not self._ahead(lane):
+                self._in_flight += 1
+                self._lane_in_flight[lane] += 1
+                waiter = None
+            else:
+                waiter = loop.create_future()
+                self._waiters[lane].append(waiter)
+        if waiter is not None:
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._lock:
+                    if waiter in self._waiters[lane]:
+                        self._waiters[lane].remove(waiter)
+                        owned = False
+                    else:
+                        # Slot já concedido; se o future foi cancelado, _wake devolve
+                        owned = not waiter.cancelled()
+                if owned:
+                    self.release(lane)
+                raise
+        try:
+            await self._take_token(lane)
+        except BaseException:
+            self.release(lane)
+            raise
+
+    def _tokens_ahead(self, lane: str) -> bool:
+        for other in LANES:
+            if other == lane:
+                return False
+            if self._waiting_tokens[other]:
+                return True
+        return False
+
+    async def _take_token(self, lane: str) -> None:
+        if self.rate <= 0 and self._paused_until <= time.monotonic():
+            return
+        with self._lock:
+            self._waiting_tokens[lane] += 1
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    if now < self._paused_until:
+                        wait = self._paused_until - now
+                    elif self.rate <= 0:
+                        return
+                    else:
+                        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+                        self._refilled_at = now
+                        if self._tokens >= 1 and not self._tokens_ahead(lane):
+                            self._tokens -= 1
+                            return
+                        wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 1 / self.rate
+                await asyncio.sleep(wait)
+        finally:
+            with self._lock:
+                self._waiting_tokens[lane] -= 1
+
+    def release(self, lane: str = LANE_INTERACTIVE) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._lane_in_flight[lane] -= 1
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        # Chamar com self._lock; lanes em ordem de prioridade
+        granted = True
+        while granted:
+            granted = False
+            for lane in LANES:
+                if self._waiters[lane] and self._can_start(lane):
+                    waiter = self._waiters[lane].popleft()
+                    self._in_flight += 1
+                    self._lane_in_flight[lane] += 1
+                    waiter.get_loop().call_soon_threadsafe(self._wake, waiter, lane)
+                    granted = True
+                    break
+
+    def _wake(self, waiter: "asyncio.Future", lane: str) -> None:
+        if waiter.cancelled():
+            # O chamador desistiu depois de ganhar o slot: repassa adiante
+            self.release(lane)
+        else:
+            waiter.set_result(None)
+
+    def on_success(self) -> None:
+        """Aumento aditivo: +1 no limite a cada `limit` sucessos."""
+        with self._lock:
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+            self._dispatch()
+
+    def on_error(self, error: BaseException) -> None:
+        """Redução multiplicativa em 429/5xx; Retry-After pausa o bucket."""
+        if not is_overload(error):
+            return
+        with self._lock:
+            now = time.monotonic()
+            self.throttled += 1
+            if now - self._decreased_at >= self.decrease_interval:
+                self._limit = max(self.min_limit, self._limit * self.backoff)
+                self._decreased_at = now
+            delay = retry_after(error)
+            if delay:
+                self._paused_until = max(self._paused_until, now + delay)
+                self._tokens = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "queued": self.queued,
+            "rate": self.rate,
+            "tokens": round(self._tokens, 2),
+            "throttled": self.throttled,
+            "paused_for": max(0.0, round(self._paused_until - time.monotonic(), 2)),
+            "lanes": {
+                lane: {
+                    "limit": self.lane_limit(lane),
+                    "in_flight": self._lane_in_flight[lane],
+                    "queued": len(self._waiters[lane]) + self._waiting_tokens[lane],
+                }
+                for lane in LANES
+            },
+        }
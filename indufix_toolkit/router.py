@@ -0,0 +1,196 @@
+"""Roteamento determinístico de consultas de lookup (sem LLM)
+
+Consultas como "equivalência DIN 933" ou "penalidade material aço carbono
+default" mapeiam direto para uma tool; o agente chama a tool e responde com
+um template, sem nenhuma chamada ao modelo:
+
+    >>> classify("equivalência DIN 933")
+    Route(tool='get_standard_equivalences', args={'standard': 'DIN 933'})
+
+Na dúvida classify() devolve None e a consulta segue para o LLM: nenhuma
+ou mais de uma intenção, pergunta aberta, várias etapas, ou qualquer
+palavra que não seja conectivo, palavra-chave da intenção, atributo ou
+parte de uma especificação reconhecida (produto, norma, material, ...).
+Assim nenhum qualificador é descartado em silêncio.
+"""
+import re
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from indufix_toolkit.canonical import fold, split_query
+
+# Atributos reconhecidos (forma sem acentos -> nome usado nas regras)
+ATTRIBUTES = {
+    "material": "material",
+    "acabamento": "acabamento",
+    "revestimento": "acabamento",
+    "finish": "acabamento",
+    "classe": "classe",
+    "norma": "norma",
+    "rosca": "rosca",
+    "comprimento": "comprimento",
+}
+
+# Métodos de inferência aceitos por get_confidence_penalty
+INFERENCE_METHODS = {
+    "default": "default",
+    "padrao": "default",
+    "pattern_match": "pattern_match",
+    "pattern": "pattern_match",
+    "regex": "pattern_match",
+    "llm": "llm",
+}
+
+# Consultas acima disso raramente são lookups puros
+MAX_WORDS = 16
+
+_EQUIVALENCE_RE = re.compile(r"\bequivalen\w*|\bequivale\b")
+_PENALTY_RE = re.compile(r"\bpenalidades?\b")
+_DEFAULTS_RE = re.compile(r"\bdefaults?\b|\bvalor(?:es)?\s+padrao\b")
+# Perguntas abertas ou com mais de uma etapa ficam com o LLM
+_OPEN_ENDED_RE = re.compile(
+    r"\b(?:por\s*que|porque|como|explic\w*|compar\w*|diferenc\w*|tambem|depois|"
+    r"alem|recomend\w*|sugir\w*|sugest\w*|analis\w*|melhor)\b"
+)
+
+# Conectivos aceitos em qualquer intenção
+_CONNECTORS = {"de", "da", "do", "das", "dos", "para", "p/", "o", "a", "os", "as", "e",
+               "em", "no", "na", "um", "uma", "=", "-", ":"}
+# Palavras-chave de cada intenção (sem acentos)
+_EQUIVALENCE_WORDS = {"equivalencia", "equivalencias", "equivalente", "equivalentes",
+                      "equivale", "norma", "normas"}
+_PENALTY_WORDS = {"penalidade", "penalidades", "confianca", "inferido", "inferida",
+                  "por", "via", "metodo", "valor"}
+_DEFAULTS_WORDS = {"default", "defaults", "valor", "valores", "padrao"}
+
+_PUNCTUATION = ",.;:?!()"
+
+
+def _words(text: str) -> List[str]:
+    words = (word.strip(_PUNCTUATION) for word in text.split())
+    return [word for word in words if word]
+
+
+class Route(NamedTuple):
+    """Tool a chamar diretamente e seus argumentos."""
+
+    tool: str
+    args: Dict[str, Any]
+
+
+def _only_words(text: str, allowed: set) -> bool:
+    return all(word in allowed for word in _words(text))
+
+
+def _equivalence_route(query: str) -> Optional[Route]:
+    spec, residual = split_query(query)
+    # Só a norma: material, produto, rosca etc. seriam ignorados pela tool
+    if len(spec.standards) != 1 or not spec._replace(standards=()).is_empty:
+        return None
+    if not _only_words(residual, _EQUIVALENCE_WORDS | _CONNECTORS):
+        return None
+    return Route("get_standard_equivalences", {"standard": spec.standards[0]})
+
+
+def _penalty_route(query: str) -> Optional[Route]:
+    skip = _PENALTY_WORDS | _CONNECTORS
+    words = [word for word in _words(query) if fold(word) not in skip]
+    folded = [fold(word) for word in words]
+    if len(words) < 3 or folded[0] not in ATTRIBUTES or folded[-1] not in INFERENCE_METHODS:
+        return None
+    # O valor inferido precisa ser uma especificação reconhecida por inteiro
+    value = " ".join(words[1:-1])
+    spec, residual = split_query(value)
+    if spec.is_empty or residual:
+        return None
+    return Route("get_confidence_penalty", {
+        "attribute": ATTRIBUTES[folded[0]],
+        "inferred_value": value,
+        "inference_method": INFERENCE_METHODS[folded[-1]],
+    })
+
+
+def _defaults_route(query: str) -> Optional[Route]:
+    spec, residual = split_query(query)
+    # Só o tipo de produto: a tool não usa rosca, norma, material etc.
+    if not spec.product_type or not spec._replace(product_type=None).is_empty:
+        return None
+    attributes: List[str] = []
+    for word in _words(residual):
+        if word in ATTRIBUTES:
+            if ATTRIBUTES[word] not in attributes:
+                attributes.append(ATTRIBUTES[word])
+        elif word not in _DEFAULTS_WORDS and word not in _CONNECTORS:
+            # Palavra desconhecida (outro produto, atributo não suportado, ...)
+            return None
+    if not attributes:
+        return None
+    return Route("get_default_values", {"product_type": spec.product_type, "missing_attributes": attributes})
+
+
+def classify(query: str) -> Optional[Route]:
+    """Rota direta para uma tool, ou None se a consulta precisa do LLM."""
+    text = fold(query)
+    if len(text.split()) > MAX_WORDS or _OPEN_ENDED_RE.search(text):
+        return None
+
+    intents = [
+        name for name, regex in (
+            ("equivalence", _EQUIVALENCE_RE),
+            ("penalty", _PENALTY_RE),
+            ("defaults", _DEFAULTS_RE),
+        )
+        if regex.search(text)
+    ]
+    if "penalty" in intents and "defaults" in intents:
+        # "penalidade ... default": aqui default é o método de inferência
+        intents.remove("defaults")
+    if len(intents) != 1:
+        return None
+
+    if intents[0] == "equivalence":
+        return _equivalence_route(query)
+    if intents[0] == "penalty":
+        return _penalty_route(query)
+    return _defaults_route(query)
+
+
+def _confidence(value: Any) -> str:
+    return f"{value:.2f}" if isinstance(value, (int, float)) else str(value)
+
+
+def render_answer(route: Route, result: Dict[str, Any]) -> str:
+    """Resposta em texto para o resultado de uma rota direta."""
+    if route.tool == "get_standard_equivalences":
+        equivalences = result.get("equivalences") or []
+        if not equivalences:
+            lines = [f"Nenhuma equivalência encontrada para {result.get('standard')}."]
+        else:
+            lines = [f"Equivalências de {result.get('standard')}:"]
+            for item in equivalences:
+                description = (item.get("description") or item.get("equivalent_standard") or "")[:200]
+                lines.append(f"- {description} (confiança {_confidence(item.get('confidence'))})")
+
+    elif route.tool == "get_confidence_penalty":
+        lines = [
+            f"Penalidade de confiança para {result.get('attribute')} = {result.get('inferred_value')} "
+            f"(inferido por {result.get('inference_method')}): {result.get('suggested_penalty')}",
+            f"Justificativa: {(result.get('justification') or '')[:300]}",
+            f"Confiança da regra: {_confidence(result.get('confidence'))}",
+        ]
+
+    else:
+        defaults = {entry["attribute"]: entry for entry in result.get("defaults") or []}
+        lines = [f"Valores default para {result.get('product_type')}:"]
+        for attribute in result.get("missing_attributes") or []:
+            entry = defaults.get(attribute)
+            if entry is None or entry.get("suggested_value") is None:
+                lines.append(f"- {attribute}: nenhuma regra encontrada")
+            else:
+                lines.append(
+                    f"- {attribute}: {entry['suggested_value']} "
+                    f"(penalidade de confiança {entry.get('confidence_penalty')})"
+                )
+
+    if result.get("degraded"):
+        lines.append(f"(Resposta degradada: {result['degraded']} - LlamaCloud indisponível)")
+    return "\n".join(lines)
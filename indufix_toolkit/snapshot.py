@@ -0,0 +1,303 @@
+"""Snapshot local do índice "Forjador Indufix" e retriever offline (BM25)
+
+O exportador baixa todos os nodes do pipeline (texto, metadata, ids) para
+um diretório compacto:
+
+    manifest.json   versão do formato, pipeline, contagem, avgdl
+    nodes.json      id, metadata, offset/length do texto, tamanho em tokens
+    postings.json   índice invertido termo -> [[node, tf], ...]
+    texts.bin       textos UTF-8 concatenados (lidos via mmap)
+
+O LocalRetriever atende as mesmas tools sem rede, com pontuação BM25.
+
+Uso:
+    python -m indufix_toolkit.snapshot export --output ./snapshot
+    python -m indufix_toolkit.snapshot query --path ./snapshot "DIN 933"
+"""
+import argparse
+import json
+import math
+import mmap
+import os
+import re
+import sys
+import unicodedata
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+MANIFEST_FILE = "manifest.json"
+NODES_FILE = "nodes.json"
+POSTINGS_FILE = "postings.json"
+TEXTS_FILE = "texts.bin"
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas, sem acentos, só alfanuméricos ("Aço M10" -> ["aco", "m10"])."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(text)
+
+
+class SnapshotNode:
+    """Node recuperado do snapshot, com a mesma interface usada pelas tools."""
+
+    __slots__ = ("id", "text", "score", "metadata")
+
+    def __init__(self, id: str, text: str, score: float, metadata: Dict[str, Any]):
+        self.id = id
+        self.text = text
+        self.score = score
+        self.metadata = metadata
+
+    def __repr__(self) -> str:
+        return f"SnapshotNode(id={self.id!r}, score={self.score:.3f})"
+
+
+# ---------------------------------------------------------------------------
+# Exportação
+# ---------------------------------------------------------------------------
+
+def iter_index_nodes(
+    index: Any,
+    page_size: int = 100,
+    call: Optional[Callable[[Callable[[], Any]], Any]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Percorre todos os chunks do pipeline do LlamaCloudIndex.
+
+    `call(request)` executa cada requisição ao LlamaCloud (ex: pelo limiter
+    e pelo circuit breaker do toolkit); o default chama direto.
+    """
+    call = call or (lambda request: request())
+    client = index._client
+    pipeline_id = index.pipeline.id
+    skip = 0
+    while True:
+        documents = call(lambda: client.pipelines.list_pipeline_documents(
+            pipeline_id, skip=skip, limit=page_size
+        ))
+        for document in documents:
+            document_metadata = document.metadata or {}
+            chunks = call(lambda: client.pipelines.list_pipeline_document_chunks(
+                document_id=document.id, pipeline_id=pipeline_id
+            ))
+            for chunk in chunks:
+                yield {
+                    "id": chunk.id,
+                    "text": chunk.text or "",
+                    "metadata": {**document_metadata, **(chunk.extra_info or {})},
+                }
+        if len(documents) < page_size:
+            break
+        skip += page_size
+
+
+def write_snapshot(
+    nodes: List[Dict[str, Any]],
+    output: Path,
+    pipeline_id: Optional[str] = None,
+    index_name: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Grava nodes ({id, text, metadata}) no formato de snapshot."""
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+
+    entries = []
+    postings: Dict[str, List[List[int]]] = {}
+    total_length = 0
+    offset = 0
+
+    with open(output / TEXTS_FILE, "wb") as texts:
+        for position, node in enumerate(nodes):
+            data = node["text"].encode("utf-8")
+            texts.write(data)
+            tokens = tokenize(node["text"])
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append([position, tf])
+            entries.append({
+                "id": node["id"],
+                "metadata": node["metadata"],
+                "offset": offset,
+                "length": len(data),
+                "tokens": len(tokens),
+            })
+            offset += len(data)
+            total_length += len(tokens)
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "index_name": index_name,
+        "pipeline_id": pipeline_id,
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+        "node_count": len(entries),
+        "avgdl": total_length / len(entries) if entries else 0.0,
+    }
+
+    with open(output / NODES_FILE, "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False, separators=(",", ":"))
+    with open(output / POSTINGS_FILE, "w", encoding="utf-8") as f:
+        json.dump(postings, f, separators=(",", ":"))
+    # Manifest por último: um snapshot sem manifest está incompleto
+    with open(output / MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    return manifest
+
+
+def export_snapshot(output: Path, index: Any = None) -> Dict[str, Any]:
+    """Exporta o índice configurado em LLAMA_CONFIG para `output`."""
+    if index is None:
+        from indufix_toolkit import get_index
+        index = get_index()
+    nodes = list(iter_index_nodes(index))
+    return write_snapshot(nodes, output, pipeline_id=index.pipeline.id, index_name=index.name)
+
+
+# ---------------------------------------------------------------------------
+# Leitura e retrieval local
+# ---------------------------------------------------------------------------
+
+class Snapshot:
+    """Snapshot carregado: metadata em memória, textos via mmap."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path / MANIFEST_FILE, encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(
+                f"Formato de snapshot não suportado: {self.manifest.get('format_version')}"
+            )
+        with open(self.path / NODES_FILE, encoding="utf-8") as f:
+            self.nodes = json.load(f)
+        with open(self.path / POSTINGS_FILE, encoding="utf-8") as f:
+            self.postings = json.load(f)
+
+        self.avgdl = self.manifest["avgdl"] or 1.0
+        count = len(self.nodes)
+        self.idf = {
+            term: math.log(1 + (count - len(plist) + 0.5) / (len(plist) + 0.5))
+            for term, plist in self.postings.items()
+        }
+
+        self._texts_file = open(self.path / TEXTS_FILE, "rb")
+        size = os.fstat(self._texts_file.fileno()).st_size
+        # mmap não aceita arquivo vazio (snapshot sem nodes)
+        self._texts = mmap.mmap(self._texts_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    @property
+    def pipeline_id(self) -> Optional[str]:
+        return self.manifest.get("pipeline_id")
+
+    def text(self, position: int) -> str:
+        entry = self.nodes[position]
+        return self._texts[entry["offset"]:entry["offset"] + entry["length"]].decode("utf-8")
+
+    def node(self, position: int, score: float = 1.0) -> SnapshotNode:
+        entry = self.nodes[position]
+        return SnapshotNode(entry["id"], self.text(position), score, entry["metadata"])
+
+    def iter_nodes(self) -> Iterator[Dict[str, Any]]:
+        for position, entry in enumerate(self.nodes):
+            yield {"id": entry["id"], "text": self.text(position), "metadata": entry["metadata"]}
+
+    def search(self, query: str, top_k: int = 5, filters: Any = None) -> List[SnapshotNode]:
+        """BM25 sobre o índice invertido; scores normalizados em [0, 1)."""
+        terms = [term for term in set(tokenize(query)) if term in self.postings]
+        if not terms:
+            return []
+
+        scores: Dict[int, float] = {}
+        for term in terms:
+            idf = self.idf[term]
+            for position, tf in self.postings[term]:
+                dl = self.nodes[position]["tokens"]
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * dl / self.avgdl)
+                scores[position] = scores.get(position, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+
+        # Limite superior teórico (tf -> infinito) para um score comparável
+        # aos do LlamaCloud, em vez de um valor BM25 sem escala
+        upper = sum(self.idf[term] * (BM25_K1 + 1) for term in terms)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+        results = []
+        for position, score in ranked:
+            if filters is not None and not matches_filters(self.nodes[position]["metadata"], filters):
+                continue
+            results.append(self.node(position, score / upper))
+            if len(results) >= top_k:
+                break
+        return results
+
+    def close(self) -> None:
+        if isinstance(self._texts, mmap.mmap):
+            self._texts.close()
+        self._texts_file.close()
+
+
+def matches_filters(metadata: Dict[str, Any], filters: Any) -> bool:
+    """Aplica MetadataFilters (igualdade, AND/OR) sobre o metadata local."""
+    conditions = getattr(filters, "condition", None)
+    condition = getattr(conditions, "value", conditions) or "and"
+    checks = []
+    for item in getattr(filters, "filters", []):
+        if hasattr(item, "filters"):
+            checks.append(matches_filters(metadata, item))
+        else:
+            checks.append(str(metadata.get(item.key)) == str(item.value))
+    if not checks:
+        return True
+    return any(checks) if condition == "or" else all(checks)
+
+
+class LocalRetriever:
+    """Retriever offline sobre um Snapshot, compatível com LlamaCloudRetriever."""
+
+    def __init__(self, snapshot: Snapshot, similarity_top_k: Optional[int] = None, filters: Any = None):
+        self.snapshot = snapshot
+        self.similarity_top_k = similarity_top_k or 5
+        self.filters = filters
+
+    def retrieve(self, query: str) -> List[SnapshotNode]:
+        return self.snapshot.search(query, self.similarity_top_k, self.filters)
+
+    async def aretrieve(self, query: str) -> List[SnapshotNode]:
+        # BM25 em memória leva microssegundos; não vale a ida ao executor
+        return self.retrieve(query)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Snapshot local do índice Indufix")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Exporta o índice LlamaCloud")
+    export_parser.add_argument("--output", default="snapshot", help="Diretório de saída")
+
+    query_parser = subparsers.add_parser("query", help="Consulta um snapshot local")
+    query_parser.add_argument("--path", default="snapshot", help="Diretório do snapshot")
+    query_parser.add_argument("--top-k", type=int, default=5)
+    query_parser.add_argument("query")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        manifest = export_snapshot(Path(args.output))
+        print(f"[OK] {manifest['node_count']} nodes exportados para {args.output}")
+        return 0
+
+    snapshot = Snapshot(Path(args.path))
+    for node in snapshot.search(args.query, args.top_k):
+        print(f"{node.score:.3f}  {node.id}  {node.text[:100]!r}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,437 @@
+"""Tools LangChain do Indufix toolkit (expostas via indufix_toolkit.TOOLS)"""
+from langchain_core.tools import tool
+import asyncio
+import os
+from typing import List, Dict, Any, Optional
+
+from indufix_toolkit import (
+    LANE_BULK,
+    METADATA_FILTERS_ENABLED,
+    PIPELINE_ENDPOINT,
+    aget_equivalence_graph,
+    aget_query_engine,
+    RULE_KIND_CONFIDENCE_PENALTY,
+    RULE_KIND_DEFAULT_VALUE,
+    aretrieve,
+    aretrieve_filtered,
+    astream_knowledge,
+    cached_call,
+    canonical_query,
+    get_http_client,
+    guarded,
+    normalize_query,
+    parse_spec,
+    pipeline_headers,
+    priority,
+    serving_from_snapshot,
+    synthesis_breaker,
+    tool_call_deadline,
+)
+
+
+async def _retrieve_matching_rules(
+    query: str,
+    top_k: int,
+    filters: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    async def compute():
+        # Filtros vêm do chamador: nada de ampliar a busca em silêncio
+        nodes = await aretrieve_filtered(query, top_k, filters, widen=False)
+        return {
+            "query": query,
+            "filters_applied": bool(filters) and METADATA_FILTERS_ENABLED,
+            "nodes": [
+                {
+                    "text": node.text,
+                    "score": node.score if hasattr(node, 'score') else 1.0,
+                    "metadata": node.metadata if hasattr(node, 'metadata') else {}
+                }
+                for node in nodes[:top_k]
+            ]
+        }
+
+    result = await cached_call("retrieve_matching_rules", query, top_k, compute, filters)
+    # A chave é a consulta canônica: devolve a consulta deste chamador
+    return {**result, "query": query}
+
+
+@tool
+async def retrieve_matching_rules(
+    query: str,
+    top_k: int = 5,
+    product_type: Optional[str] = None,
+    rule_kind: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Recupera regras de matching da base Indufix via LlamaCloud Index.
+    
+    Use para:
+    - Buscar valores default para atributos ausentes
+    - Encontrar equivalências de padrões (DIN 933 = ISO 4017)
+    - Obter penalidades de confiança para valores inferidos
+    - Recuperar mapeamentos Odoo
+    
+    Args:
+        query: Consulta de busca (ex: "parafuso M10 valores default")
+        top_k: Número de resultados (default: 5)
+        product_type: Restringe a busca a um tipo de produto (opcional)
+        rule_kind: Restringe a um tipo de regra, ex: "default_value",
+            "confidence_penalty" (opcional)
+    
+    Returns:
+        dict com nodes contendo text, score e metadata, e filters_applied
+        (False se os filtros de metadata estiverem desativados)
+    """
+    filters = {"product_type": product_type, "rule_kind": rule_kind}
+    filters = {key: value for key, value in filters.items() if value}
+    return await _retrieve_matching_rules(query, top_k, filters or None)
+
+
+BATCH_MAX_CONCURRENCY = int(os.getenv("INDUFIX_BATCH_MAX_CONCURRENCY", "8"))
+
+
+@tool
+async def retrieve_matching_rules_batch(queries: List[str], top_k: int = 5) -> Dict[str, Any]:
+    """
+    Recupera regras de matching para várias consultas em uma única chamada.
+
+    Consultas equivalentes (mesma forma canônica) são executadas uma só vez e as demais rodam em
+    paralelo (com limite de concorrência). Prefira esta tool a várias
+    chamadas de retrieve_matching_rules quando tiver uma lista de SKUs.
+    As consultas vão na lane bulk: chamadas interativas passam na frente.
+
+    Args:
+        queries: Lista de consultas (ex: ["parafuso M10 DIN 933", "porca M8"])
+        top_k: Número de resultados por consulta (default: 5)
+
+    Returns:
+        dict com results na mesma ordem de queries
+    """
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+    async def run_one(query: str) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                with priority(LANE_BULK):
+                    return await _retrieve_matching_rules(query, top_k)
+            except Exception as e:
+                return {"query": query, "nodes": [], "error": str(e)}
+
+    unique: Dict[str, str] = {}
+    for query in queries:
+        unique.setdefault(canonical_query(query), query)
+
+    keys = list(unique)
+    results = await asyncio.gather(*(run_one(unique[key]) for key in keys))
+    by_key = dict(zip(keys, results))
+
+    return {
+        "top_k": top_k,
+        "unique_queries": len(keys),
+        "results": [
+            {**by_key[canonical_query(query)], "query": query}
+            for query in queries
+        ]
+    }
+
+
+def _stream_writer():
+    """Stream writer do LangGraph, ou None fora de uma execução do grafo."""
+    try:
+        from langgraph.config import get_stream_writer
+        return get_stream_writer()
+    except (ImportError, RuntimeError, KeyError):
+        return None
+
+
+@tool
+async def query_indufix_knowledge(query: str) -> str:
+    """
+    Consulta a base de conhecimento Indufix com resposta processada.
+    
+    Usa o query engine que processa e sintetiza a resposta baseada
+    nos documentos recuperados.
+    
+    Args:
+        query: Pergunta em linguagem natural
+    
+    Returns:
+        str com resposta sintetizada
+    """
+    writer = _stream_writer()
+    if writer is None:
+        async def answer():
+            query_engine = await aget_query_engine()
+            return str(await query_engine.aquery(query))
+
+        return await guarded("query_indufix_knowledge", answer, synthesis_breaker)
+
+    # Dentro do grafo: repassa os chunks no stream_mode="custom" enquanto
+    # a síntese acontece, e devolve o texto completo como resultado da tool
+    async def stream():
+        chunks = []
+        async for chunk in astream_knowledge(query):
+            chunks.append(chunk)
+            writer({"tool": "query_indufix_knowledge", "chunk": chunk})
+        return "".join(chunks)
+
+    return await guarded("query_indufix_knowledge", stream, synthesis_breaker)
+
+
+DEFAULTS_PER_ATTRIBUTE_TOP_K = 3
+
+
+def _default_entry(attr: str, node: Any) -> Dict[str, Any]:
+    return {
+        "attribute": attr,
+        "suggested_value": node.metadata.get("default_value") if hasattr(node, 'metadata') else None,
+        "confidence_penalty": node.metadata.get("penalty", 0.1) if hasattr(node, 'metadata') else 0.1,
+        "source": node.text[:200] if hasattr(node, 'text') else ""
+    }
+
+
+def _best_node_for_attribute(attr: str, nodes: List[Any]) -> Any:
+    """Prefere o node cujo metadata.attribute bate com o atributo pedido."""
+    wanted = normalize_query(attr)
+    for node in nodes:
+        metadata = node.metadata if hasattr(node, 'metadata') else {}
+        if normalize_query(str(metadata.get("attribute", ""))) == wanted:
+            return node
+    return nodes[0] if nodes else None
+
+
+async def _default_for_attribute(product_type: str, attr: str) -> Optional[Dict[str, Any]]:
+    query = f"valor default {attr} para {product_type}"
+
+    filters = {
+        "product_type": parse_spec(product_type).product_type or product_type,
+        "attribute": attr,
+        "rule_kind": RULE_KIND_DEFAULT_VALUE,
+    }
+
+    async def compute():
+        nodes = await aretrieve_filtered(query, DEFAULTS_PER_ATTRIBUTE_TOP_K, filters)
+        node = _best_node_for_attribute(attr, nodes)
+        return {"entry": _default_entry(attr, node) if node is not None else None}
+
+    result = await cached_call(
+        "get_default_values:attribute", query, DEFAULTS_PER_ATTRIBUTE_TOP_K, compute, filters,
+        deadline_name="get_default_values",
+    )
+    return result["entry"]
+
+
+@tool
+async def get_default_values(
+    product_type: str,
+    missing_attributes: List[str],
+    per_attribute: bool = True
+) -> Dict[str, Any]:
+    """
+    Busca valores default para atributos ausentes de um tipo de produto.
+    
+    Args:
+        product_type: Tipo do produto (ex: "parafuso_sextavado", "porca")
+        missing_attributes: Lista de atributos faltantes (ex: ["material", "acabamento"])
+        per_attribute: Uma busca dedicada por atributo, em paralelo (default: True).
+            Com False, usa uma única busca combinada para todos os atributos.
+    
+    Returns:
+        dict com valores default e penalidades de confiança
+    """
+    if per_attribute:
+        semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+        async def lookup(attr: str) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                return await _default_for_attribute(product_type, attr)
+
+        # Um só deadline para o fan-out inteiro, não um por atributo
+        with tool_call_deadline("get_default_values"):
+            entries = await asyncio.gather(*(lookup(attr) for attr in missing_attributes))
+        return {
+            "product_type": product_type,
+            "missing_attributes": missing_attributes,
+            "defaults": [entry for entry in entries if entry is not None]
+        }
+
+    query = f"valores default para {product_type}: {', '.join(missing_attributes)}"
+    filters = {
+        "product_type": parse_spec(product_type).product_type or product_type,
+        "rule_kind": RULE_KIND_DEFAULT_VALUE,
+    }
+
+    async def compute():
+        nodes = await aretrieve_filtered(query, None, filters)
+
+        defaults = []
+        for i, attr in enumerate(missing_attributes):
+            if i < len(nodes):
+                defaults.append(_default_entry(attr, nodes[i]))
+
+        return {
+            "product_type": product_type,
+            "missing_attributes": missing_attributes,
+            "defaults": defaults
+        }
+
+    return await cached_call("get_default_values", query, None, compute, filters)
+
+
+@tool
+async def get_standard_equivalences(standard: str) -> Dict[str, Any]:
+    """
+    Busca equivalências entre normas/padrões técnicos.
+
+    Normas conhecidas são respondidas pelo grafo de equivalências (inclui
+    equivalências transitivas); as demais via busca no índice.
+    
+    Args:
+        standard: Norma ou padrão (ex: "DIN 933", "ISO 4017", "ASTM A307")
+    
+    Returns:
+        dict com normas equivalentes e especificações
+    """
+    graph = await aget_equivalence_graph()
+    equivalents = graph.equivalents(standard) if graph is not None else None
+    if equivalents is not None:
+        return {
+            "standard": standard,
+            "equivalences": [
+                {
+                    "equivalent_standard": item["standard"],
+                    "description": (
+                        f"{standard} equivale a {item['standard']}"
+                        + (" (por transitividade)" if item["transitive"] else "")
+                    ),
+                    "confidence": 1.0
+                }
+                for item in equivalents
+            ]
+        }
+
+    # Norma fora do grafo (ou grafo ainda em construção): busca vetorial
+    query = f"equivalência norma padrão {standard} fastener"
+
+    async def compute():
+        nodes = await aretrieve(query)
+
+        equivalences = []
+        for node in nodes:
+            equivalences.append({
+                "equivalent_standard": node.metadata.get("equivalent") if hasattr(node, 'metadata') else None,
+                "description": node.text if hasattr(node, 'text') else "",
+                "confidence": node.score if hasattr(node, 'score') else 1.0
+            })
+
+        return {
+            "standard": standard,
+            "equivalences": equivalences
+        }
+
+    return await cached_call("get_standard_equivalences", query, None, compute)
+
+
+@tool
+async def get_confidence_penalty(
+    attribute: str,
+    inferred_value: str,
+    inference_method: str
+) -> Dict[str, Any]:
+    """
+    Obtém penalidade de confiança para valor inferido.
+    
+    Args:
+        attribute: Nome do atributo (ex: "material", "acabamento")
+        inferred_value: Valor inferido (ex: "aço carbono", "zincado")
+        inference_method: Método usado (ex: "default", "pattern_match", "llm")
+    
+    Returns:
+        dict com penalidade sugerida e justificativa
+    """
+    query = f"penalidade confiança {attribute} {inferred_value} inferido por {inference_method}"
+    filters = {"attribute": attribute, "rule_kind": RULE_KIND_CONFIDENCE_PENALTY}
+
+    async def compute():
+        # Só o melhor node é usado: pede exatamente 1 ao LlamaCloud
+        nodes = await aretrieve_filtered(query, 1, filters)
+
+        if nodes and len(nodes) > 0:
+            best_match = nodes[0]
+            return {
+                "attribute": attribute,
+                "inferred_value": inferred_value,
+                "inference_method": inference_method,
+                "suggested_penalty": best_match.metadata.get("penalty", 0.15) if hasattr(best_match, 'metadata') else 0.15,
+                "justification": best_match.text if hasattr(best_match, 'text') else "",
+                "confidence": best_match.score if hasattr(best_match, 'score') else 1.0
+            }
+
+        return {
+            "attribute": attribute,
+            "inferred_value": inferred_value,
+            "inference_method": inference_method,
+            "suggested_penalty": 0.2,  # default penalty
+            "justification": "Nenhuma regra específica encontrada",
+            "confidence": 0.0
+        }
+
+    result = await cached_call("get_confidence_penalty", query, 1, compute, filters)
+    # A chave é a consulta canônica: devolve os valores deste chamador
+    return {
+        **result,
+        "attribute": attribute,
+        "inferred_value": inferred_value,
+        "inference_method": inference_method,
+    }
+
+
+@tool
+async def pipeline_retrieve_raw(query: str, top_k: int = 5) -> Dict[str, Any]:
+    """
+    Chamada direta ao pipeline endpoint (fallback/debug).
+    
+    Args:
+        query: Query de busca
+        top_k: Número de resultados
+    
+    Returns:
+        dict com resposta raw do pipeline
+    """
+    async def compute():
+        if serving_from_snapshot():
+            # Upstream fora: mesmo formato do endpoint, a partir do snapshot
+            nodes = await aretrieve(query, top_k)
+            return {
+                "retrieval_nodes": [
+                    {
+                        "node": {"id_": node.id, "text": node.text, "extra_info": node.metadata},
+                        "score": node.score,
+                    }
+                    for node in nodes
+                ]
+            }
+
+        response = await get_http_client().post(
+            PIPELINE_ENDPOINT,
+            json={"query": query, "top_k": top_k},
+            headers=pipeline_headers(),
+        )
+        response.raise_for_status()
+        return response.json()
+
+    # A query vai literal ao endpoint: a forma canônica (tokens reordenados,
+    # termos traduzidos) juntaria consultas com respostas diferentes
+    return await cached_call("pipeline_retrieve_raw", query, top_k, compute, canonical=False)
+
+
+# Lista de tools exportadas
+TOOLS = [
+    retrieve_matching_rules,
+    retrieve_matching_rules_batch,
+    query_indufix_knowledge,
+    get_default_values,
+    get_standard_equivalences,
+    get_confidence_penalty,
+    pipeline_retrieve_raw,
+]
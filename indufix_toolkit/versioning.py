@@ -0,0 +1,108 @@
+"""Detecção de mudança de versão do índice para invalidar caches
+
+Uma sonda barata (metadata do pipeline, sem busca vetorial) roda no máximo
+uma vez por intervalo. Quando a versão muda, a geração é incrementada e os
+listeners são avisados; como a versão faz parte das chaves de cache,
+entradas antigas deixam de ser servidas imediatamente.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class IndexVersionMonitor:
+    """Acompanha a versão do índice com uma sonda limitada por intervalo."""
+
+    def __init__(
+        self,
+        probe: Callable[[], Awaitable[str]],
+        interval: float = 60.0,
+        timeout: Optional[float] = None,
+        last_known: Optional[Callable[[], Awaitable[Optional[str]]]] = None,
+    ):
+        self._probe = probe
+        self.interval = interval
+        # Espera máxima pela primeira sonda; depois disso vale a última versão
+        # conhecida (ex: persistida junto do cache em disco), se houver
+        self.timeout = timeout
+        self._last_known = last_known
+        self._last_known_loaded = False
+        self.version: Optional[str] = None
+        self.generation = 0
+        self._checked_at: Optional[float] = None
+        self._task: Optional["asyncio.Task"] = None
+        self._timed_out: Optional["asyncio.Task"] = None
+        self._listeners: List[Callable[[Optional[str], str], None]] = []
+
+    def add_listener(self, listener: Callable[[Optional[str], str], None]) -> None:
+        """Registra `listener(versão_anterior, nova_versão)` para mudanças."""
+        self._listeners.append(listener)
+
+    async def current(self) -> Optional[str]:
+        """Versão conhecida do índice; dispara a sonda se o intervalo venceu.
+
+        Só a primeira sonda é aguardada (até lá não há versão para compor as
+        chaves), e no máximo `timeout` segundos. As seguintes rodam em
+        background, sem somar latência. Se a primeira sonda falhar ou
+        demorar, usa a última versão conhecida, para que entradas antigas
+        ainda possam ser servidas durante uma queda.
+        """
+        if self.interval <= 0:
+            return None
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.interval:
+            self._checked_at = now
+            self._task = loop.create_task(self.check())
+        task = self._task
+        if (
+            self.version is None and task is not None and not task.done()
+            and task.get_loop() is loop and task is not self._timed_out
+        ):
+            try:
+                await asyncio.wait_for(asyncio.shield(task), self.timeout)
+            except asyncio.TimeoutError:
+                # As próximas chamadas não esperam de novo por esta mesma sonda
+                self._timed_out = task
+                logger.warning(f"Sonda de versão do índice passou de {self.timeout}s; usando a última conhecida")
+        if self.version is None and self._last_known is not None and not self._last_known_loaded:
+            self._last_known_loaded = True
+            try:
+                self.version = await self._last_known()
+            except Exception as e:
+                logger.warning(f"Falha ao ler a última versão conhecida do índice: {e}")
+        return self.version
+
+    async def check(self) -> Optional[str]:
+        """Executa a sonda agora e aplica a mudança de versão, se houver."""
+        try:
+            version = await self._probe()
+        except Exception as e:
+            logger.warning(f"Falha ao consultar versão do índice: {e}")
+            return self.version
+        return self.update(version)
+
+    def update(self, version: str) -> Optional[str]:
+        """Aplica uma versão obtida fora da sonda (ex: pelo warm-up síncrono)."""
+        if version != self.version:
+            previous, self.version = self.version, version
+            if previous is not None:
+                self.generation += 1
+                logger.info(f"Índice mudou de versão ({previous} -> {version}); caches invalidados")
+                for listener in self._listeners:
+                    try:
+                        listener(previous, version)
+                    except Exception as e:
+                        logger.warning(f"Listener de versão do índice falhou: {e}")
+        return self.version
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "generation": self.generation,
+            "interval": self.interval,
+            "timeout": self.timeout,
+        }
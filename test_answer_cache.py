@@ -0,0 +1,130 @@
+"""Behaviour tests for the agent's whole-answer cache (offline, no network)
+
+The Anthropic model is replaced by a scripted fake chat model, so the
+answer_cache -> agent -> tools -> store_answer path of the compiled graph
+runs without any API key or network access.
+
+Usage:
+    python -m pytest test_answer_cache.py
+"""
+import asyncio
+from typing import Any, List
+
+import pytest
+
+pytest.importorskip("langgraph")
+pytest.importorskip("langchain_anthropic")
+
+from langchain_core.language_models import BaseChatModel  # noqa: E402
+from langchain_core.messages import AIMessage, HumanMessage  # noqa: E402
+from langchain_core.outputs import ChatGeneration, ChatResult  # noqa: E402
+
+import agent  # noqa: E402
+import indufix_toolkit  # noqa: E402
+from indufix_toolkit.versioning import IndexVersionMonitor  # noqa: E402
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Answers with the queued replies, or echoes the last human message."""
+
+    replies: List[Any] = []
+    calls: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        question = [msg for msg in messages if isinstance(msg, HumanMessage)][-1].content
+        self.calls.append(question)
+        reply = self.replies.pop(0) if self.replies else AIMessage(content=f"resposta: {question}")
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    import langchain_anthropic
+
+    model = ScriptedChatModel(replies=[], calls=[])
+    version = {"value": "v1"}
+
+    async def probe():
+        return version["value"]
+
+    monitor = IndexVersionMonitor(probe, interval=3600)
+    monkeypatch.setattr(langchain_anthropic, "ChatAnthropic", lambda **kwargs: model)
+    monkeypatch.setattr(indufix_toolkit, "index_version", monitor)
+    monkeypatch.setattr(agent, "PROMPT_CACHE_ENABLED", False)
+    monkeypatch.setattr(agent, "FAST_PATH_ENABLED", False)
+    monkeypatch.setattr(agent, "_answer_cache", None)
+    compiled = agent.create_agent()
+    compiled.model = model
+    compiled.version = version
+    compiled.monitor = monitor
+    return compiled
+
+
+def _ask(graph, *turns: str):
+    messages = []
+    for index, text in enumerate(turns):
+        if index:
+            messages.append(AIMessage(content="..."))
+        messages.append(HumanMessage(content=text))
+    result = asyncio.run(graph.ainvoke({"messages": messages}))
+    return result["messages"][-1]
+
+
+def test_repeated_question_is_answered_from_the_cache(graph):
+    first = _ask(graph, "Qual o material default do parafuso sextavado?")
+    second = _ask(graph, "  qual o material DEFAULT do parafuso sextavado?")
+    assert second.content == first.content
+    assert second.response_metadata.get("answer_cache") == "hit"
+    assert len(graph.model.calls) == 1
+
+
+def test_reordered_or_translated_questions_do_not_share_an_answer(graph):
+    _ask(graph, "converter DIN 933 para ISO 4017")
+    reverse = _ask(graph, "converter ISO 4017 para DIN 933")
+    assert reverse.content == "resposta: converter ISO 4017 para DIN 933"
+    _ask(graph, "parafuso sextavado M10")
+    english = _ask(graph, "hex bolt M10")
+    assert english.content == "resposta: hex bolt M10"
+    assert len(graph.model.calls) == 4
+
+
+def test_multi_turn_conversations_bypass_the_cache(graph):
+    _ask(graph, "equivalência DIN 933")
+    follow_up = _ask(graph, "equivalência DIN 933", "equivalência DIN 933")
+    assert follow_up.response_metadata.get("answer_cache") is None
+    assert len(graph.model.calls) == 2
+    # Nor is the multi-turn answer stored for the single-turn question
+    assert len(agent.get_answer_cache()) == 1
+
+
+def test_answers_built_on_degraded_results_are_not_stored(graph, monkeypatch):
+    async def degraded_rules(query, top_k, filters=None):
+        return {"query": query, "nodes": [], "degraded": "snapshot"}
+
+    monkeypatch.setattr(indufix_toolkit.tools, "_retrieve_matching_rules", degraded_rules)
+    graph.model.replies.append(AIMessage(
+        content="",
+        tool_calls=[{"name": "retrieve_matching_rules", "args": {"query": "parafuso M10"}, "id": "call-1"}],
+    ))
+    graph.model.replies.append(AIMessage(content="resposta degradada"))
+    assert _ask(graph, "regras do parafuso M10").content == "resposta degradada"
+    assert len(agent.get_answer_cache()) == 0
+    _ask(graph, "regras do parafuso M10")
+    assert len(graph.model.calls) == 3
+
+
+def test_index_version_change_invalidates_answers(graph):
+    _ask(graph, "equivalência DIN 933")
+    graph.version["value"] = "v2"
+    asyncio.run(graph.monitor.check())
+    assert graph.monitor.generation == 1
+    answer = _ask(graph, "equivalência DIN 933")
+    assert answer.response_metadata.get("answer_cache") is None
+    assert len(graph.model.calls) == 2
@@ -0,0 +1,132 @@
+"""Behaviour tests for indufix_toolkit.cache (offline, no network)
+
+Covers single-flight coalescing of identical in-flight calls, the in-memory
+LRU/TTL cache and the SQLite layer behind it.
+
+Usage:
+    python -m pytest test_cache.py
+"""
+import asyncio
+import time
+
+import pytest
+
+from indufix_toolkit.cache import SingleFlight, SQLiteCache, TTLCache
+
+
+def test_single_flight_runs_identical_calls_once():
+    flight = SingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"nodes": [1, 2]}
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("key", fetch) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert calls == [1]
+    assert all(result == {"nodes": [1, 2]} for result in results)
+    # Each caller gets its own copy
+    results[0]["nodes"].append(3)
+    assert results[1] == {"nodes": [1, 2]}
+    assert flight.stats() == {"in_flight": 0, "executions": 1, "shared": 4}
+
+
+def test_single_flight_different_keys_run_separately():
+    flight = SingleFlight()
+
+    async def scenario():
+        return await asyncio.gather(
+            flight.do("a", lambda: asyncio.sleep(0, "a")),
+            flight.do("b", lambda: asyncio.sleep(0, "b")),
+        )
+
+    assert asyncio.run(scenario()) == ["a", "b"]
+    assert flight.executions == 2
+
+
+def test_single_flight_shares_errors_and_forgets_the_key():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ConnectionError("down")
+
+    async def scenario():
+        results = await asyncio.gather(flight.do("key", fail), flight.do("key", fail), return_exceptions=True)
+        assert all(isinstance(result, ConnectionError) for result in results)
+        assert len(flight) == 0
+        assert await flight.do("key", lambda: asyncio.sleep(0, "ok")) == "ok"
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_survives_a_cancelled_caller():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "value"
+
+    async def scenario():
+        first = asyncio.create_task(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == "value"
+    assert flight.executions == 1
+
+
+def test_ttl_cache_expiry_and_stale_reads():
+    cache = TTLCache(maxsize=10, ttl=0.01)
+    cache.set("key", {"value": 1})
+    assert cache.get("key") == {"value": 1}
+    time.sleep(0.02)
+    assert cache.get("key") is None
+    assert cache.get_stale("key") == {"value": 1}
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_returns_copies():
+    cache = TTLCache()
+    value = {"nodes": []}
+    cache.set("key", value)
+    value["nodes"].append("changed")
+    cache.get("key")["nodes"].append("changed")
+    assert cache.get("key") == {"nodes": []}
+
+
+def test_sqlite_cache_round_trip_and_namespace(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    key = (None, "retrieve_matching_rules", "parafuso M10", 5, None)
+    cache = SQLiteCache(path, namespace="pipeline-a")
+    cache.set(key, {"nodes": [{"text": "regra"}]})
+    assert SQLiteCache(path, namespace="pipeline-a").get(key) == {"nodes": [{"text": "regra"}]}
+    # Opening with another namespace (new pipeline) drops the old entries
+    assert SQLiteCache(path, namespace="pipeline-b").get(key) is None
+    assert SQLiteCache(path, namespace="pipeline-a").get(key) is None
+
+
+def test_sqlite_cache_stale_reads(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"), namespace="pipeline", ttl=-1)
+    cache.set("key", "value")
+    assert cache.get("key") is None
+    assert cache.get_stale("key") == "value"
@@ -0,0 +1,83 @@
+"""Behaviour tests for indufix_toolkit.canonical (offline, no network)
+
+Covers the fastener spec parser and the canonical query used as cache and
+dedup key: equivalent spellings must collide, different specs must not.
+
+Usage:
+    python -m pytest test_canonical.py
+"""
+from indufix_toolkit.canonical import canonical_query, fold, parse_spec, split_query
+
+
+def test_equivalent_spellings_share_the_canonical_query():
+    expected = "parafuso sextavado M10 DIN 933 zincado"
+    assert canonical_query("parafuso sextavado M10x1,5 DIN933 zincado") == expected
+    assert canonical_query("Parafuso Sextavado M10 DIN 933 zincado") == expected
+    assert canonical_query("  PARAFUSO   sextavado m10 din 933 Zincado ") == expected
+
+
+def test_tool_argument_form_matches_free_text():
+    assert parse_spec("parafuso_sextavado").product_type == "parafuso_sextavado"
+    assert canonical_query("parafuso_sextavado") == canonical_query("parafuso sextavado")
+
+
+def test_fine_pitch_is_kept_in_the_key():
+    spec = parse_spec("M10x1,25")
+    assert (spec.thread, spec.pitch, spec.length) == ("M10", 1.25, None)
+    assert canonical_query("M10x1,25") != canonical_query("M10")
+
+
+def test_coarse_pitch_is_implicit():
+    assert parse_spec("M10").pitch == 1.5
+    assert canonical_query("M10x1.5") == "M10"
+
+
+def test_short_lengths_are_not_read_as_pitch():
+    for query, thread, length in (("M3x6", "M3", 6), ("M4x5", "M4", 5), ("M5x6", "M5", 6), ("M10x30", "M10", 30)):
+        spec = parse_spec(query)
+        assert (spec.thread, spec.length) == (thread, length), query
+        assert canonical_query(query) == query
+
+
+def test_pitch_and_length():
+    spec = parse_spec("M10x1,25x40")
+    assert (spec.pitch, spec.length) == (1.25, 40)
+
+
+def test_bare_steel_is_not_carbon_steel():
+    spec, residual = split_query("parafuso aço")
+    assert spec.material is None
+    assert residual == "aco"
+    assert canonical_query("parafuso aço") != canonical_query("parafuso aço carbono")
+    assert parse_spec("aço carbono").material == "aco_carbono"
+
+
+def test_stainless_grade():
+    assert parse_spec("inox 304").material == "aco_inox_304"
+    assert parse_spec("hex bolt M12 stainless").material == "aco_inox"
+
+
+def test_property_class_and_product():
+    spec = parse_spec("Porca M8 classe 8.8")
+    assert (spec.product_type, spec.thread, spec.property_class) == ("porca", "M8", "8.8")
+
+
+def test_residual_keeps_unrecognised_words():
+    spec, residual = split_query("parafuso M10 para madeira")
+    assert spec.product_type == "parafuso"
+    assert residual == "para madeira"
+
+
+def test_fold_removes_accents_and_case():
+    assert fold("Aço Zincado Padrão") == "aco zincado padrao"
+
+
+def test_raw_cache_keys_keep_word_order():
+    from indufix_toolkit import cache_key
+
+    forward, reverse = "converter DIN 933 para ISO 4017", "converter ISO 4017 para DIN 933"
+    assert cache_key("tool", forward) == cache_key("tool", reverse)
+    assert cache_key("tool", forward, canonical=False) != cache_key("tool", reverse, canonical=False)
+    assert cache_key("tool", "  Converter DIN 933 para ISO 4017", canonical=False) == cache_key(
+        "tool", forward, canonical=False
+    )
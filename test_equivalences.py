@@ -0,0 +1,121 @@
+"""Behaviour tests for indufix_toolkit.equivalences (offline, no network)
+
+Covers code normalization, the union-find graph built from node metadata
+(direct and transitive equivalences) and the background build of the
+toolkit's shared graph.
+
+Usage:
+    python -m pytest test_equivalences.py
+"""
+import time
+
+import indufix_toolkit
+from indufix_toolkit.equivalences import EquivalenceGraph, find_standards, normalize_standard
+
+
+def test_normalize_standard():
+    assert normalize_standard("din-933") == "DIN 933"
+    assert normalize_standard("ISO4017") == "ISO 4017"
+    assert normalize_standard("ISO 4017:2011") == "ISO 4017"
+    assert find_standards("Parafuso DIN933 equivale a ISO 4017") == ["DIN 933", "ISO 4017"]
+
+
+def test_graph_from_metadata_is_transitive():
+    graph = EquivalenceGraph.from_nodes([
+        {"text": "", "metadata": {"standard": "DIN 933", "equivalent": "ISO 4017"}},
+        {"text": "", "metadata": {"norma": "ISO 4017", "equivalent": ["ASTM A307"]}},
+        {"text": "sem equivalências", "metadata": {"standard": "DIN 934"}},
+    ])
+    assert graph.equivalents("din933") == [
+        {"standard": "ASTM A307", "transitive": True},
+        {"standard": "ISO 4017", "transitive": False},
+    ]
+    assert "ASTM A307" in graph
+    assert graph.equivalents("DIN 934") is None
+
+
+def test_source_standard_falls_back_to_the_text():
+    graph = EquivalenceGraph.from_nodes([
+        {"text": "A norma DIN 125 corresponde à ISO 7089", "metadata": {"equivalent": "ISO 7089"}},
+    ])
+    assert graph.equivalents("DIN 125") == [{"standard": "ISO 7089", "transitive": False}]
+
+
+def test_shared_graph_builds_in_background_and_retries_failures(monkeypatch):
+    monkeypatch.setattr(indufix_toolkit, "RETRIEVAL_BACKEND", "cloud")
+    monkeypatch.setattr(indufix_toolkit, "snapshot_available", lambda: False)
+    monkeypatch.setattr(indufix_toolkit, "EQUIVALENCE_RETRY_INTERVAL", 60)
+    indufix_toolkit.refresh_equivalence_graph()
+
+    def failing_source(loop=None):
+        raise ConnectionError("down")
+
+    monkeypatch.setattr(indufix_toolkit, "_equivalence_source_nodes", failing_source)
+    # Never blocks the caller: None until the background build is done
+    assert indufix_toolkit.get_equivalence_graph() is None
+    _wait_for(lambda: indufix_toolkit._equivalence_failed_at is not None)
+    # A failed build is not cached as an empty graph, and not retried right away
+    assert indufix_toolkit.get_equivalence_graph() is None
+    assert indufix_toolkit._equivalence_graph is None
+
+    nodes = [{"text": "", "metadata": {"standard": "DIN 933", "equivalent": "ISO 4017"}}]
+    monkeypatch.setattr(indufix_toolkit, "_equivalence_source_nodes", lambda loop=None: nodes)
+    monkeypatch.setattr(indufix_toolkit, "EQUIVALENCE_RETRY_INTERVAL", 0)
+    indufix_toolkit.get_equivalence_graph()
+    _wait_for(lambda: indufix_toolkit._equivalence_graph is not None)
+    assert "ISO 4017" in indufix_toolkit.get_equivalence_graph()
+    indufix_toolkit.refresh_equivalence_graph()
+
+
+def test_cloud_graph_crawls_the_live_index_through_the_limiter(monkeypatch):
+    class Document:
+        id = "doc-1"
+        metadata = {"standard": "DIN 933"}
+
+    class Chunk:
+        id = "chunk-1"
+        text = ""
+        extra_info = {"equivalent": "ISO 4017"}
+
+    class Pipelines:
+        def list_pipeline_documents(self, pipeline_id, skip, limit):
+            return [Document()]
+
+        def list_pipeline_document_chunks(self, document_id, pipeline_id):
+            return [Chunk()]
+
+    class Index:
+        class _client:
+            pipelines = Pipelines()
+
+        class pipeline:
+            id = "pipeline"
+
+    # A snapshot on disk must not be used as the source in cloud mode
+    monkeypatch.setattr(indufix_toolkit, "RETRIEVAL_BACKEND", "cloud")
+    monkeypatch.setattr(indufix_toolkit, "snapshot_available", lambda: True)
+    monkeypatch.setattr(indufix_toolkit, "_index", Index())
+    guarded_calls = []
+    original_guarded = indufix_toolkit.guarded
+
+    async def recording_guarded(tool_name, fn, breaker=None):
+        guarded_calls.append((tool_name, indufix_toolkit.current_lane()))
+        return await original_guarded(tool_name, fn, breaker)
+
+    monkeypatch.setattr(indufix_toolkit, "guarded", recording_guarded)
+    indufix_toolkit.refresh_equivalence_graph()
+
+    assert indufix_toolkit.get_equivalence_graph() is None
+    _wait_for(lambda: indufix_toolkit._equivalence_graph is not None)
+    graph = indufix_toolkit.get_equivalence_graph()
+    assert graph.equivalents("DIN 933") == [{"standard": "ISO 4017", "transitive": False}]
+    # One page of documents plus one chunk request, both in the bulk lane
+    assert guarded_calls == [("equivalence_crawl", "bulk")] * 2
+    indufix_toolkit.refresh_equivalence_graph()
+
+
+def _wait_for(condition, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
@@ -0,0 +1,89 @@
+"""Import-time budget for indufix_toolkit and agent.py
+
+Runs `python -X importtime` in a fresh interpreter and fails when:
+- a heavy dependency is pulled in at import time (it must load on first use)
+- the cumulative import time of the module exceeds its budget
+
+Budgets can be overridden for slow machines with INDUFIX_IMPORT_BUDGET_MS.
+
+Usage:
+    python -m pytest test_import_time.py
+    python test_import_time.py
+"""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+# Modules that must NOT be imported by a bare `import <module>`
+HEAVY_MODULES = (
+    "llama_cloud_services",
+    "llama_index",
+    "httpx",
+    "langchain_core",
+    "langchain_anthropic",
+    "langgraph",
+)
+
+# Cumulative import time budget per module (ms), excluding interpreter startup
+DEFAULT_BUDGET_MS = float(os.getenv("INDUFIX_IMPORT_BUDGET_MS", "250"))
+
+
+def measure_import(module: str):
+    """Return (cumulative_ms, imported_module_names) for a fresh `import module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    imported = []
+    cumulative_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        name = name.rstrip()
+        imported.append(name.strip())
+        if name.strip() == module and not name.startswith("  "):
+            cumulative_us = int(cumulative)
+    return cumulative_us / 1000, imported
+
+
+def _heavy_imports(imported):
+    return sorted({
+        name for name in imported
+        if name.split(".")[0] in HEAVY_MODULES
+    })
+
+
+def test_toolkit_import_is_light():
+    elapsed_ms, imported = measure_import("indufix_toolkit")
+    assert not _heavy_imports(imported), f"heavy imports at startup: {_heavy_imports(imported)}"
+    assert elapsed_ms <= DEFAULT_BUDGET_MS, f"import indufix_toolkit took {elapsed_ms:.1f} ms"
+
+
+def test_agent_import_is_light():
+    elapsed_ms, imported = measure_import("agent")
+    assert not _heavy_imports(imported), f"heavy imports at startup: {_heavy_imports(imported)}"
+    assert elapsed_ms <= DEFAULT_BUDGET_MS, f"import agent took {elapsed_ms:.1f} ms"
+
+
+if __name__ == "__main__":
+    failed = 0
+    for module in ("indufix_toolkit", "agent"):
+        elapsed_ms, imported = measure_import(module)
+        heavy = _heavy_imports(imported)
+        ok = not heavy and elapsed_ms <= DEFAULT_BUDGET_MS
+        failed += not ok
+        status = "[PASS]" if ok else "[FAIL]"
+        print(f"{status} import {module}: {elapsed_ms:.1f} ms (budget {DEFAULT_BUDGET_MS:.0f} ms)")
+        if heavy:
+            print(f"       heavy imports: {', '.join(heavy)}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,261 @@
+"""Behaviour tests for indufix_toolkit.resilience (offline, no network)
+
+Covers which errors count as upstream failures, the circuit breaker
+(open, half-open probe, release on local errors), the adaptive limiter
+lanes and cancellation, and hedged().
+
+Usage:
+    python -m pytest test_resilience.py
+"""
+import asyncio
+
+import pytest
+
+from indufix_toolkit.resilience import (
+    LANE_BULK,
+    LANE_INTERACTIVE,
+    AdaptiveLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    LatencyTracker,
+    hedged,
+    is_upstream_failure,
+)
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+async def _raise(error: BaseException):
+    raise error
+
+
+async def _ok():
+    return "ok"
+
+
+def test_only_real_upstream_failures_count():
+    assert is_upstream_failure(asyncio.TimeoutError())
+    assert is_upstream_failure(ConnectionResetError())
+    assert is_upstream_failure(StatusError(429))
+    assert is_upstream_failure(StatusError(503))
+    assert not is_upstream_failure(StatusError(404))
+    assert not is_upstream_failure(KeyError("text"))
+    assert not is_upstream_failure(ValueError("bad payload"))
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(asyncio.TimeoutError):
+                await breaker.call(lambda: _raise(asyncio.TimeoutError()))
+        with pytest.raises(CircuitOpenError):
+            await breaker.call(_ok)
+
+    asyncio.run(scenario())
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.stats()["trips"] == 1
+
+
+def test_local_errors_do_not_trip_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+
+    async def scenario():
+        for _ in range(5):
+            with pytest.raises(KeyError):
+                await breaker.call(lambda: _raise(KeyError("text")))
+            with pytest.raises(StatusError):
+                await breaker.call(lambda: _raise(StatusError(400)))
+
+    asyncio.run(scenario())
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_allows_one_probe_then_closes():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05, half_open_max_calls=1)
+
+    async def scenario():
+        with pytest.raises(ConnectionError):
+            await breaker.call(lambda: _raise(ConnectionError()))
+        assert breaker.state == CircuitBreaker.OPEN
+        await asyncio.sleep(0.06)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+
+        release = asyncio.Event()
+
+        async def slow_probe():
+            await release.wait()
+            return "probe"
+
+        probe = asyncio.create_task(breaker.call(slow_probe))
+        await asyncio.sleep(0)
+        # Only one probe at a time while half-open
+        with pytest.raises(CircuitOpenError):
+            await breaker.call(_ok)
+        release.set()
+        assert await probe == "probe"
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_failed_probe_reopens_and_local_error_releases_the_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+
+    async def scenario():
+        with pytest.raises(ConnectionError):
+            await breaker.call(lambda: _raise(ConnectionError()))
+        await asyncio.sleep(0.06)
+        # A local error says nothing about the upstream: the probe slot is freed
+        with pytest.raises(KeyError):
+            await breaker.call(lambda: _raise(KeyError("text")))
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(asyncio.TimeoutError):
+            await breaker.call(lambda: _raise(asyncio.TimeoutError()))
+        assert breaker.state == CircuitBreaker.OPEN
+
+    asyncio.run(scenario())
+
+
+def test_interactive_lane_goes_first():
+    limiter = AdaptiveLimiter(initial_limit=1, max_limit=1)
+    order = []
+
+    async def worker(lane: str, name: str):
+        await limiter.acquire(lane)
+        order.append(name)
+        await asyncio.sleep(0.01)
+        limiter.release(lane)
+
+    async def scenario():
+        await limiter.acquire(LANE_BULK)
+        tasks = [asyncio.create_task(worker(LANE_BULK, "bulk"))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(worker(LANE_INTERACTIVE, "interactive")))
+        await asyncio.sleep(0)
+        limiter.release(LANE_BULK)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert order == ["interactive", "bulk"]
+    assert limiter.in_flight == 0
+
+
+def test_bulk_lane_cap_leaves_room_for_interactive():
+    limiter = AdaptiveLimiter(initial_limit=4, max_limit=4, lane_caps={LANE_BULK: 0.5})
+
+    async def scenario():
+        for _ in range(2):
+            await limiter.acquire(LANE_BULK)
+        blocked = asyncio.create_task(limiter.acquire(LANE_BULK))
+        await asyncio.sleep(0)
+        assert not blocked.done()
+        await asyncio.wait_for(limiter.acquire(LANE_INTERACTIVE), 0.1)
+        blocked.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await blocked
+
+    asyncio.run(scenario())
+    assert limiter.stats()["lanes"][LANE_BULK]["in_flight"] == 2
+    assert limiter.queued == 0
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    limiter = AdaptiveLimiter(initial_limit=1, max_limit=1)
+
+    async def scenario():
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        # Slot handed over and the waiter cancelled before it could run
+        limiter.release()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+        assert limiter.in_flight == 0
+        await asyncio.wait_for(limiter.acquire(), 0.1)
+        limiter.release()
+
+    asyncio.run(scenario())
+    assert limiter.in_flight == 0
+
+
+def test_overload_halves_the_limit():
+    limiter = AdaptiveLimiter(initial_limit=8, max_limit=8)
+    limiter.on_error(StatusError(503))
+    assert limiter.limit == 4
+    limiter.on_error(StatusError(404))
+    assert limiter.limit == 4
+
+
+def test_hedged_returns_the_faster_route_and_cancels_the_other():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append("primary")
+            raise
+        return "primary"
+
+    async def fast():
+        return "secondary"
+
+    async def scenario():
+        return await hedged(slow, fast, delay=0.01)
+
+    assert asyncio.run(scenario()) == "secondary"
+    assert cancelled == ["primary"]
+
+
+def test_hedged_skips_the_secondary_when_primary_is_fast():
+    calls = []
+
+    async def secondary():
+        calls.append("secondary")
+        return "secondary"
+
+    assert asyncio.run(hedged(_ok, secondary, delay=0.5)) == "ok"
+    assert calls == []
+
+
+def test_hedged_fires_secondary_at_once_when_primary_fails():
+    assert asyncio.run(hedged(lambda: _raise(ConnectionError()), _ok, delay=10)) == "ok"
+
+
+def test_latency_percentile():
+    tracker = LatencyTracker(window=10)
+    assert tracker.percentile(95) is None
+    for value in range(1, 11):
+        tracker.record(value / 10)
+    assert tracker.percentile(50) == pytest.approx(0.5)
+    assert tracker.percentile(100) == pytest.approx(1.0)
+
+
+def test_queue_wait_past_the_deadline_is_not_an_upstream_failure(monkeypatch):
+    import indufix_toolkit
+
+    breaker = CircuitBreaker(failure_threshold=1000, reset_timeout=60)
+    monkeypatch.setattr(indufix_toolkit, "upstream_breaker", breaker)
+    monkeypatch.setattr(indufix_toolkit, "upstream_limiter", AdaptiveLimiter(initial_limit=2, max_limit=2))
+    monkeypatch.setitem(indufix_toolkit.TOOL_DEADLINES, "slow_tool", 0.45)
+
+    async def healthy_upstream():
+        await asyncio.sleep(0.2)
+        return "ok"
+
+    async def scenario():
+        calls = [indufix_toolkit.guarded("slow_tool", healthy_upstream) for _ in range(60)]
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert "ok" in results
+    assert all(result == "ok" or isinstance(result, asyncio.TimeoutError) for result in results)
+    assert breaker.stats()["consecutive_failures"] == 0
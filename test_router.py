@@ -0,0 +1,65 @@
+"""Behaviour tests for indufix_toolkit.router (offline, no network)
+
+The deterministic router must only answer lookups it fully understands;
+anything with an unrecognised qualifier goes to the LLM (classify() -> None).
+
+Usage:
+    python -m pytest test_router.py
+"""
+from indufix_toolkit.router import Route, classify, render_answer
+
+
+def test_equivalence_lookup():
+    assert classify("equivalência DIN 933") == Route("get_standard_equivalences", {"standard": "DIN 933"})
+    assert classify("Equivalências da norma ISO 4017?") == Route("get_standard_equivalences", {"standard": "ISO 4017"})
+
+
+def test_penalty_lookup():
+    assert classify("penalidade material aço carbono default") == Route("get_confidence_penalty", {
+        "attribute": "material",
+        "inferred_value": "aço carbono",
+        "inference_method": "default",
+    })
+    route = classify("penalidade acabamento zincado via regex")
+    assert route.args["inference_method"] == "pattern_match"
+
+
+def test_defaults_lookup():
+    assert classify("valores default de material e acabamento para parafuso sextavado") == Route(
+        "get_default_values",
+        {"product_type": "parafuso_sextavado", "missing_attributes": ["material", "acabamento"]},
+    )
+
+
+def test_unrecognised_qualifiers_go_to_the_llm():
+    for query in (
+        # English question: the words "if", "are", "missing" are not understood
+        "What are the default values for a hex bolt M10 if material and finish are missing?",
+        # Two product types
+        "default de acabamento para parafuso e porca",
+        # Material qualifier the equivalence tool would ignore
+        "equivalência DIN 933 para aço inox",
+        # Negation
+        "não use default: qual o material do parafuso sextavado?",
+        # Ambiguous value ("aço" alone is not a recognised material)
+        "penalidade material aço default",
+    ):
+        assert classify(query) is None, query
+
+
+def test_open_ended_and_multi_intent_go_to_the_llm():
+    assert classify("por que a equivalência DIN 933 existe?") is None
+    assert classify("penalidade material aço carbono default e equivalência DIN 933") is None
+
+
+def test_render_defaults_reports_missing_rules_and_degradation():
+    route = Route("get_default_values", {})
+    text = render_answer(route, {
+        "product_type": "parafuso",
+        "missing_attributes": ["material", "acabamento"],
+        "defaults": [{"attribute": "material", "suggested_value": "aco", "confidence_penalty": 0.1}],
+        "degraded": "stale_cache",
+    })
+    assert "- material: aco" in text
+    assert "- acabamento: nenhuma regra encontrada" in text
+    assert "degradada" in text
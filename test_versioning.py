@@ -0,0 +1,99 @@
+"""Behaviour tests for indufix_toolkit.versioning (offline, no network)
+
+Covers IndexVersionMonitor.current() with a fake probe: the bounded wait
+for the first probe and the fallback to the last known version, version
+changes (generation and listeners) and the disabled monitor.
+
+Usage:
+    python -m pytest test_versioning.py
+"""
+import asyncio
+
+from indufix_toolkit.versioning import IndexVersionMonitor
+
+
+class FakeProbe:
+    def __init__(self, version: str = "v1", delay: float = 0.0):
+        self.version = version
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.version
+
+
+def test_slow_first_probe_falls_back_to_the_last_known_version():
+    probe = FakeProbe("v2", delay=0.2)
+    last_known_calls = []
+
+    async def last_known():
+        last_known_calls.append(1)
+        return "v1"
+
+    monitor = IndexVersionMonitor(probe, interval=3600, timeout=0.02, last_known=last_known)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        assert await monitor.current() == "v1"
+        assert loop.time() - started < 0.15
+        # Later calls neither wait for the same probe again nor reload the fallback
+        started = loop.time()
+        assert await monitor.current() == "v1"
+        assert loop.time() - started < 0.02
+        await monitor._task
+        return await monitor.current()
+
+    # Once the probe lands, its version replaces the fallback
+    assert asyncio.run(scenario()) == "v2"
+    assert last_known_calls == [1]
+    assert probe.calls == 1
+    assert monitor.generation == 1
+
+
+def test_version_change_bumps_generation_and_notifies_listeners():
+    probe = FakeProbe("v1")
+    monitor = IndexVersionMonitor(probe, interval=0.05)
+    changes = []
+    monitor.add_listener(lambda previous, version: changes.append((previous, version)))
+
+    async def scenario():
+        assert await monitor.current() == "v1"
+        probe.version = "v2"
+        # Still within the interval: no new probe
+        assert await monitor.current() == "v1"
+        await asyncio.sleep(0.06)
+        # Interval expired: the probe runs in background, without blocking
+        assert await monitor.current() == "v1"
+        await monitor._task
+        return await monitor.current()
+
+    assert asyncio.run(scenario()) == "v2"
+    assert probe.calls == 2
+    assert monitor.generation == 1
+    # The first version seen is not a change
+    assert changes == [("v1", "v2")]
+
+
+def test_failing_listener_does_not_stop_the_others():
+    monitor = IndexVersionMonitor(FakeProbe(), interval=60)
+    changes = []
+
+    def broken(previous, version):
+        raise RuntimeError("boom")
+
+    monitor.add_listener(broken)
+    monitor.add_listener(lambda previous, version: changes.append(version))
+    monitor.update("v1")
+    monitor.update("v2")
+    assert changes == ["v2"]
+
+
+def test_disabled_monitor_returns_none_without_probing():
+    probe = FakeProbe()
+    for interval in (0, -1):
+        monitor = IndexVersionMonitor(probe, interval=interval)
+        assert asyncio.run(monitor.current()) is None
+    assert probe.calls == 0